@@ -2,19 +2,40 @@
 """
 Стабильный сервер с реальными данными из Telegram
 """
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-import io
 import time
-import requests
+import httpx
 import logging
 import os
 import asyncio
+import base64
+import bisect
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import re
+import sqlite3
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import random
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Без brotli отдаем gzip
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -22,7 +43,27 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Creative MVP - Real Telegram Data")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запуск и остановка фоновых задач"""
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, keepalive_expiry=60),
+        follow_redirects=True
+    )
+    cache_warmer.start()
+    counter_refresher.start()
+    generation_jobs.start()
+    yield
+    await generation_jobs.stop()
+    await counter_refresher.stop()
+    await cache_warmer.stop()
+    await telegram_client.disconnect()
+    await http_client.aclose()
+    post_store.close()
+
+app = FastAPI(title="Creative MVP - Real Telegram Data", lifespan=lifespan)
 
 # Модели данных
 class FeedItem(BaseModel):
@@ -40,23 +81,742 @@ class FeedItem(BaseModel):
 class PromptReq(BaseModel):
     feed_item_id: str
 
+class FeedItemsReq(BaseModel):
+    feed_item_ids: list[str]
+
+# Исходящие HTTP запросы: общий пул соединений на все приложение
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+http_client = None  # httpx.AsyncClient, создается в lifespan
+
+DEMO_PHOTO_URL = "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop"
+
+# Очередь генерации изображений
+GEN_WORKERS = int(os.getenv("GEN_WORKERS", "2"))  # Одновременных запросов к FAL
+GEN_QUEUE_MAX = int(os.getenv("GEN_QUEUE_MAX", "50"))  # Максимум задач в очереди
+GEN_JOB_TTL = float(os.getenv("GEN_JOB_TTL", "3600"))  # Сколько хранить завершенные задачи, секунды
+GEN_SUBMIT_RATE = float(os.getenv("GEN_SUBMIT_RATE", "2"))  # Максимум отправок в FAL в секунду, 0 - без ограничения
+GEN_BATCH_MAX = int(os.getenv("GEN_BATCH_MAX", "100"))  # Максимум постов в одном batch запросе
+GEN_MODEL = os.getenv("GEN_MODEL", "fal-ai/flux-pro")
+# derived: seed выводится из промпта, одинаковые запросы дают одинаковую картинку и кэшируются
+# random: каждый запрос - новый seed, без кэша и объединения
+GEN_SEED_POLICY = os.getenv("GEN_SEED_POLICY", "derived")
+GEN_RESULT_TTL = float(os.getenv("GEN_RESULT_TTL", "86400"))  # Сколько хранить готовые результаты, секунды
+GEN_RESULT_MAX = int(os.getenv("GEN_RESULT_MAX", "1000"))  # Максимум результатов в кэше
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))  # Пинг открытых SSE соединений, секунды
+
+# Пул сессий Telegram: TELEGRAM_SESSION плюс TELEGRAM_SESSIONS через запятую
+# (строки StringSession или пути к файлам *.session)
+TELEGRAM_SESSIONS = [spec.strip() for spec in os.getenv("TELEGRAM_SESSIONS", "").split(",") if spec.strip()]
+# FloodWait короче порога Telethon пересыпает сам; 0 - сразу переключаемся на другую сессию
+TELEGRAM_FLOOD_SLEEP = int(os.getenv("TELEGRAM_FLOOD_SLEEP", "0"))
+
+# Планировщик запросов к Telegram: лимит запросов в секунду и запас на всплеск по типам RPC
+TG_RATE_RESOLVE = float(os.getenv("TG_RATE_RESOLVE", "0.5"))  # ResolveUsername - самый строгий лимит
+TG_BURST_RESOLVE = int(os.getenv("TG_BURST_RESOLVE", "3"))
+TG_RATE_HISTORY = float(os.getenv("TG_RATE_HISTORY", "5"))  # GetHistory / GetMessages
+TG_BURST_HISTORY = int(os.getenv("TG_BURST_HISTORY", "10"))
+TG_RATE_FILE = float(os.getenv("TG_RATE_FILE", "10"))  # GetFile
+TG_BURST_FILE = int(os.getenv("TG_BURST_FILE", "20"))
+TG_FLOOD_WAIT_MAX = float(os.getenv("TG_FLOOD_WAIT_MAX", "120"))  # Дольше FloodWait не ждем - отдаем сохраненные посты
+PHOTO_FLOOD_WAIT_MAX = float(os.getenv("PHOTO_FLOOD_WAIT_MAX", "5"))  # Фото ждут пользователи - дольше отдаем демо
+TG_FLOOD_RETRIES = int(os.getenv("TG_FLOOD_RETRIES", "3"))  # Повторов после FloodWait на один вызов
+PRIORITY_INTERACTIVE = 0  # Запросы пользователей
+PRIORITY_BACKGROUND = 1  # Прогрев и фоновое обновление
+
 # Реальные рабочие каналы (найдены через find_working_channels.py)
 # Для MVP оставляем только 3 канала Fashion для стабильности
 WORKING_CHANNELS = {
     "fashion": ["rogov24", "burimovasasha", "zarina_brand"]
 }
 
+# Параллельная загрузка каналов категории
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", "8"))  # Максимум одновременных загрузок каналов
+FEED_CHANNEL_TIMEOUT = float(os.getenv("FEED_CHANNEL_TIMEOUT", "8"))  # Дедлайн на один канал, секунды
+# Окно канала: столько последних постов загружаем один раз и отвечаем на любой limit слиянием окон.
+# Глубокие страницы расширяют окно кратно этому размеру
+FEED_CHANNEL_WINDOW = int(os.getenv("FEED_CHANNEL_WINDOW", "25"))
+FEED_MAX_WINDOW = int(os.getenv("FEED_MAX_WINDOW", "500"))  # Глубже этого окна канала лента не листается
+FEED_MAX_LIMIT = int(os.getenv("FEED_MAX_LIMIT", "100"))  # Максимум постов на странице ленты
+
+# Ограничения кэша постов
+POST_CACHE_MAX_ENTRIES = int(os.getenv("POST_CACHE_MAX_ENTRIES", "256"))
+POST_CACHE_MAX_BYTES = int(os.getenv("POST_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# Сколько секунд после TTL еще можно отдавать устаревшие посты, пока идет фоновое обновление
+POST_CACHE_MAX_STALE = float(os.getenv("POST_CACHE_MAX_STALE", "3600"))
+
+# Локальное хранилище постов
+POST_STORE_PATH = os.getenv("POST_STORE_PATH", "posts.db")
+POST_STORE_RESCAN = int(os.getenv("POST_STORE_RESCAN", "50"))  # Сколько последних id перечитывать ради просмотров/реакций
+MIN_POST_VIEWS = 500  # Посты с меньшим числом просмотров в ленту не попадают
+
+# Дисковый кэш фото
+PHOTO_CACHE_DIR = os.getenv("PHOTO_CACHE_DIR", "photo_cache")
+PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Прогрев кэша: раньше TTL, чтобы пользователи не попадали на устаревшие записи
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "1") == "1"
+WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", "240"))
+WARMER_JITTER = float(os.getenv("WARMER_JITTER", "0.2"))  # Доля случайного разброса интервала
+# Доля каналов, которые должны прогреться за проход, чтобы /ready ответил 200. Остальные отдаются
+# из хранилища или демо, поэтому по умолчанию достаточно завершенного прохода прогрева
+WARMER_READY_RATIO = float(os.getenv("WARMER_READY_RATIO", "0"))
+
+# Live-обновления каналов через события Telethon (аккаунт должен быть подписан на каналы)
+LIVE_UPDATES_ENABLED = os.getenv("LIVE_UPDATES_ENABLED", "1") == "1"
+LIVE_CACHE_TTL = float(os.getenv("LIVE_CACHE_TTL", "1800"))  # Свежесть окна канала, пока приходят события
+LIVE_CHECK_INTERVAL = float(os.getenv("LIVE_CHECK_INTERVAL", "5"))  # Проверка соединения live-сессии, секунды
+WARMER_LIVE_INTERVAL = float(os.getenv("WARMER_LIVE_INTERVAL", "1800"))  # Интервал прогрева при live-обновлениях
+
+# Обновление просмотров/реакций/комментариев без перезагрузки сообщений
+COUNTER_REFRESH_ENABLED = os.getenv("COUNTER_REFRESH_ENABLED", "1") == "1"
+COUNTER_REFRESH_INTERVAL = float(os.getenv("COUNTER_REFRESH_INTERVAL", "60"))
+COUNTER_REFRESH_IDS = min(100, int(os.getenv("COUNTER_REFRESH_IDS", "100")))  # id за один запрос счетчиков, максимум API - 100
+
+# Ограничение памяти собранных страниц ленты
+FEED_PAGE_MEMO_MAX = int(os.getenv("FEED_PAGE_MEMO_MAX", "256"))
+FEED_COMPRESS_MIN_BYTES = int(os.getenv("FEED_COMPRESS_MIN_BYTES", "1024"))  # Меньшие ответы не сжимаем
+
+# Push изменений ленты в браузер (SSE)
+LIVE_FEED_QUEUE_MAX = int(os.getenv("LIVE_FEED_QUEUE_MAX", "32"))  # Неотправленных событий на соединение, дальше - reset
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "5000"))  # Открытых потоков на процесс
+
+def _feed_sort_key(post):
+    """Порядок ленты: больше просмотров выше, при равенстве - по каналу и новее"""
+    return (-post['views'], post['channel'], -post['message_id'])
+
+class CacheEntry:
+    """Окно постов канала в кэше"""
+    __slots__ = ("posts", "ranked", "window", "version", "fetched_at", "fresh_until", "expires_at", "size")
+    
+    def __init__(self, posts, window: int, version: int, ttl: float, max_stale: float, fetched_at: float = None):
+        self.posts = posts  # От новых к старым
+        self.ranked = sorted(posts, key=_feed_sort_key)  # В порядке ленты, сортируем один раз на загрузку
+        self.window = window  # Сколько постов запрашивали при загрузке
+        self.version = version  # Меняется при каждом обновлении окна
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.fresh_until = self.fetched_at + ttl
+        self.expires_at = self.fresh_until + max_stale  # Жесткая граница устаревания
+        self.size = len(json.dumps(posts, ensure_ascii=False).encode("utf-8"))
+
+class PostCache:
+    """LRU-кэш постов по каналам с TTL и ограничением по числу записей и байтам"""
+    def __init__(self, ttl: float, max_stale: float = POST_CACHE_MAX_STALE,
+                 max_entries: int = POST_CACHE_MAX_ENTRIES, max_bytes: int = POST_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # channel -> CacheEntry, от старых к свежим по использованию
+        self.total_bytes = 0
+        self.versions = itertools.count(1)
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self.on_update = None  # callback(channel, старые посты, новые посты) при замене окна
+    
+    def get(self, channel: str, limit: int):
+        """(посты, устарели ли) если в кэше есть окно канала не меньше limit, иначе None"""
+        entry = self.entries.get(channel)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if time.time() >= entry.expires_at:
+            self._remove(channel)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        if limit > entry.window:
+            # Окно меньше запрошенного - нужно загрузить больше
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(channel)
+        stale = time.time() >= entry.fresh_until
+        self.stats["stale_hits" if stale else "hits"] += 1
+        return entry.posts[:limit], stale
+    
+    def put(self, channel: str, posts, window: int, ttl: float = None, fetched_at: float = None):
+        """Сохраняем окно постов канала и вытесняем старые записи при переполнении"""
+        previous = self.entries.get(channel)
+        if previous is not None:
+            self._remove(channel)
+        entry = CacheEntry(posts, window, next(self.versions), self.ttl if ttl is None else ttl, self.max_stale, fetched_at)
+        self.entries[channel] = entry
+        self.total_bytes += entry.size
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+        if previous is not None and self.on_update is not None:
+            self.on_update(channel, previous.posts, posts)
+    
+    def ranked(self, channel: str, limit: int):
+        """(версия, первые limit постов окна в порядке ленты) или None, если окна нет"""
+        entry = self.entries.get(channel)
+        if entry is None or limit > entry.window:
+            return None
+        if limit >= len(entry.posts):
+            return entry.version, entry.ranked
+        # Окно шире запроса: оставляем только limit самых новых, порядок уже готов
+        cutoff = entry.posts[limit - 1]['message_id']
+        return entry.version, [post for post in entry.ranked if post['message_id'] >= cutoff]
+    
+    def find_post(self, channel: str, post_id: str):
+        """Пост из окна канала без учета свежести и без обновления статистики"""
+        entry = self.entries.get(channel)
+        if entry is None:
+            return None
+        for post in entry.posts:
+            if post['id'] == post_id:
+                return post
+        return None
+    
+    def _remove(self, channel: str):
+        entry = self.entries.pop(channel)
+        self.total_bytes -= entry.size
+    
+    def get_stats(self):
+        return {**self.stats, "entries": len(self.entries), "bytes": self.total_bytes}
+
+class PostStore:
+    """Хранилище постов в SQLite (WAL), ключ - (channel, message_id)"""
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self.lock = threading.Lock()  # Одно соединение на все потоки
+    
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.row_factory = sqlite3.Row
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS posts (
+                    channel TEXT NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    views INTEGER NOT NULL,
+                    likes INTEGER NOT NULL,
+                    comments INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    has_photo INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    photo_id INTEGER,
+                    PRIMARY KEY (channel, message_id)
+                )
+            """)
+            # Базы, созданные до появления photo_id
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(posts)")}
+            if "photo_id" not in columns:
+                self.db.execute("ALTER TABLE posts ADD COLUMN photo_id INTEGER")
+            # access_hash свой у каждого аккаунта. Старая таблица без account - просто кэш, пересоздаем
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(entities)")}
+            if columns and "account" not in columns:
+                self.db.execute("DROP TABLE entities")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS entities (
+                    account INTEGER NOT NULL,
+                    username TEXT NOT NULL,
+                    peer_id INTEGER NOT NULL,
+                    access_hash INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (account, username)
+                )
+            """)
+            self.db.commit()
+        return self.db
+    
+    def _upsert(self, channel: str, rows):
+        with self.lock:
+            db = self._connect()
+            db.executemany("""
+                INSERT INTO posts (channel, message_id, text, views, likes, comments, date, has_photo, photo_id, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (channel, message_id) DO UPDATE SET
+                    text = excluded.text, views = excluded.views, likes = excluded.likes,
+                    comments = excluded.comments, has_photo = excluded.has_photo,
+                    photo_id = excluded.photo_id, updated_at = excluded.updated_at
+            """, [(channel, *row, time.time()) for row in rows])
+            db.commit()
+    
+    def _delete(self, channel: str, message_ids):
+        with self.lock:
+            db = self._connect()
+            db.executemany(
+                "DELETE FROM posts WHERE channel = ? AND message_id = ?",
+                [(channel, message_id) for message_id in message_ids]
+            )
+            db.commit()
+    
+    def _delete_missing(self, channel: str, after_id: int, keep_ids):
+        with self.lock:
+            db = self._connect()
+            stored = db.execute(
+                "SELECT message_id FROM posts WHERE channel = ? AND message_id > ?", (channel, after_id)
+            ).fetchall()
+            keep = set(keep_ids)
+            deleted = [(channel, row[0]) for row in stored if row[0] not in keep]
+            db.executemany("DELETE FROM posts WHERE channel = ? AND message_id = ?", deleted)
+            db.commit()
+        return len(deleted)
+    
+    def _bounds(self, channel: str):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT MIN(message_id), MAX(message_id), COUNT(*) FROM posts WHERE channel = ?", (channel,)
+            ).fetchone()
+        return row[0], row[1], row[2]
+    
+    def _latest(self, channel: str, limit: int):
+        with self.lock:
+            rows = self._connect().execute("""
+                SELECT * FROM posts WHERE channel = ? AND views >= ?
+                ORDER BY message_id DESC LIMIT ?
+            """, (channel, MIN_POST_VIEWS, limit)).fetchall()
+        return [self._row_to_post(row) for row in rows]
+    
+    def _ids_from(self, channel: str, min_id: int):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT message_id FROM posts WHERE channel = ? AND message_id >= ? ORDER BY message_id DESC",
+                (channel, min_id)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def _update_counters(self, channel: str, rows):
+        with self.lock:
+            db = self._connect()
+            db.executemany("""
+                UPDATE posts SET
+                    views = COALESCE(?, views), likes = COALESCE(?, likes),
+                    comments = COALESCE(?, comments), updated_at = ?
+                WHERE channel = ? AND message_id = ?
+            """, [(views, likes, comments, time.time(), channel, message_id) for views, likes, comments, message_id in rows])
+            db.commit()
+    
+    def _photo_id(self, channel: str, message_id: int):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT photo_id FROM posts WHERE channel = ? AND message_id = ?", (channel, message_id)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def _load_entities(self, account: int):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT username, peer_id, access_hash FROM entities WHERE account = ?", (account,)
+            ).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+    
+    def _save_entity(self, account: int, username: str, peer_id: int, access_hash: int):
+        with self.lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO entities (account, username, peer_id, access_hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (account, username, peer_id, access_hash, time.time())
+            )
+            db.commit()
+    
+    def _delete_entity(self, username: str):
+        with self.lock:
+            db = self._connect()
+            db.execute("DELETE FROM entities WHERE username = ?", (username,))
+            db.commit()
+    
+    @staticmethod
+    def _row_to_post(row):
+        channel, message_id = row["channel"], row["message_id"]
+        return {
+            'id': f"{channel}_{message_id}",
+            'channel': channel,
+            'message_id': message_id,
+            'text': row["text"],
+            'views': row["views"],
+            'likes': row["likes"],
+            'comments': row["comments"],
+            'date': row["date"],
+            'media_url': f"/photo/{channel}/{message_id}" if row["has_photo"] else "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop",
+            'post_url': f"https://t.me/{channel}/{message_id}"
+        }
+    
+    @staticmethod
+    def message_to_row(message):
+        """Поля сообщения Telethon в порядке колонок таблицы"""
+        return (
+            message.id,
+            (message.text or "No text")[:200],
+            message.views or 0,
+            PostStore.reaction_count(message.reactions),
+            message.replies.replies if message.replies else 0,
+            message.date.isoformat(),
+            1 if message.photo else 0,
+            message.photo.id if message.photo else None
+        )
+    
+    @staticmethod
+    def reaction_count(reactions):
+        """Сумма всех реакций сообщения (MessageReactions)"""
+        return sum(result.count for result in reactions.results) if reactions else 0
+    
+    # Асинхронные обертки: SQLite работает в пуле потоков, не блокируя event loop
+    async def upsert(self, channel: str, rows):
+        if rows:
+            await asyncio.to_thread(self._upsert, channel, rows)
+    
+    async def delete(self, channel: str, message_ids):
+        """Удаляет сообщения канала по id"""
+        if message_ids:
+            await asyncio.to_thread(self._delete, channel, message_ids)
+    
+    async def delete_missing(self, channel: str, after_id: int, keep_ids):
+        """Удаляет сообщения новее after_id, которых нет в keep_ids (удалены в канале)"""
+        deleted = await asyncio.to_thread(self._delete_missing, channel, after_id, keep_ids)
+        if deleted:
+            logger.info(f"🗑️ Removed {deleted} deleted messages of {channel} from store")
+        return deleted
+    
+    async def bounds(self, channel: str):
+        """(min message_id, max message_id, число сохраненных сообщений)"""
+        return await asyncio.to_thread(self._bounds, channel)
+    
+    async def latest(self, channel: str, limit: int):
+        """Последние посты канала, прошедшие порог просмотров"""
+        return await asyncio.to_thread(self._latest, channel, limit)
+    
+    async def ids_from(self, channel: str, min_id: int):
+        """id сохраненных сообщений канала от min_id и новее, включая посты ниже порога просмотров"""
+        return await asyncio.to_thread(self._ids_from, channel, min_id)
+    
+    async def update_counters(self, channel: str, rows):
+        """(views, likes, comments, message_id); None - оставить прежнее значение"""
+        if rows:
+            await asyncio.to_thread(self._update_counters, channel, rows)
+    
+    def _get_post(self, channel: str, message_id: int):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT * FROM posts WHERE channel = ? AND message_id = ?", (channel, message_id)
+            ).fetchone()
+        return self._row_to_post(row) if row else None
+    
+    async def get_post(self, channel: str, message_id: int):
+        """Один пост из хранилища или None"""
+        return await asyncio.to_thread(self._get_post, channel, message_id)
+    
+    async def photo_id(self, channel: str, message_id: int):
+        """Telegram id фото сообщения, если сообщение уже синхронизировано"""
+        return await asyncio.to_thread(self._photo_id, channel, message_id)
+    
+    async def load_entities(self, account: int):
+        """username -> (peer_id, access_hash) для всех известных аккаунту каналов"""
+        return await asyncio.to_thread(self._load_entities, account)
+    
+    async def save_entity(self, account: int, username: str, peer_id: int, access_hash: int):
+        await asyncio.to_thread(self._save_entity, account, username, peer_id, access_hash)
+    
+    async def delete_entity(self, username: str):
+        """Удаляет entity канала у всех аккаунтов"""
+        await asyncio.to_thread(self._delete_entity, username)
+    
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+post_store = PostStore(POST_STORE_PATH)
+
+class PhotoCache:
+    """Дисковый кэш фото по Telegram photo id с LRU-вытеснением по размеру"""
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = OrderedDict()  # photo_id -> размер файла, от давно не использованных к свежим
+        self.total_bytes = 0
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    def _path(self, photo_id: int):
+        return os.path.join(self.directory, f"{photo_id}.jpg")
+    
+    def _load(self):
+        """Восстанавливаем индекс с диска, порядок LRU - по mtime"""
+        if self.loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # Недописанный файл от прерванной записи
+                os.remove(path)
+                continue
+            stem, ext = os.path.splitext(name)
+            if ext == ".jpg" and stem.isdigit():
+                stat = os.stat(path)
+                files.append((stat.st_mtime, int(stem), stat.st_size))
+        for _, photo_id, size in sorted(files):
+            self.index[photo_id] = size
+            self.total_bytes += size
+        self.loaded = True
+    
+    def get(self, photo_id: int):
+        """Путь к файлу фото или None"""
+        with self.lock:
+            self._load()
+            if photo_id not in self.index:
+                self.stats["misses"] += 1
+                return None
+            path = self._path(photo_id)
+            try:
+                os.utime(path)  # mtime хранит порядок LRU между перезапусками
+            except FileNotFoundError:
+                self.total_bytes -= self.index.pop(photo_id)
+                self.stats["misses"] += 1
+                return None
+            self.index.move_to_end(photo_id)
+            self.stats["hits"] += 1
+            return path
+    
+    def open_temp(self):
+        """Временный файл в папке кэша для потоковой записи"""
+        with self.lock:
+            self._load()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        return os.fdopen(fd, "wb"), tmp_path
+    
+    def commit(self, photo_id: int, tmp_path: str):
+        """Атомарно публикуем дописанный файл (rename) и вытесняем старые"""
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            os.replace(tmp_path, self._path(photo_id))
+            self.total_bytes -= self.index.pop(photo_id, 0)
+            self.index[photo_id] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.index) > 1:
+                oldest, oldest_size = self.index.popitem(last=False)
+                try:
+                    os.remove(self._path(oldest))
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= oldest_size
+                self.stats["evictions"] += 1
+    
+    @staticmethod
+    def discard(tmp_path: str):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+    
+    def get_stats(self):
+        return {**self.stats, "files": len(self.index), "bytes": self.total_bytes}
+
+photo_cache = PhotoCache(PHOTO_CACHE_DIR, PHOTO_CACHE_MAX_BYTES)
+
 # Telegram клиент с кэшированием
+class SessionsCoolingDown(Exception):
+    """Все сессии пула в FloodWait"""
+    def __init__(self, seconds: float):
+        super().__init__(f"All Telegram sessions are in FloodWait for {seconds:.0f}s")
+        self.seconds = seconds
+
+class TelegramSession:
+    """Одна авторизованная сессия пула со своим кэшем entity (access_hash привязан к аккаунту)"""
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.account = None  # id аккаунта - ключ entity в хранилище
+        self.entities = {}  # username -> InputPeerChannel, чтобы не вызывать ResolveUsername
+        self.active = 0  # Текущие запросы через эту сессию
+        self.cooldown_until = 0.0
+        self.stats = {"requests": 0, "flood_waits": 0}
+
+class SessionPool:
+    """Пул сессий Telegram: запрос идет в наименее загруженную, при равенстве - по кругу"""
+    def __init__(self):
+        self.sessions = []
+        self.turn = itertools.count()
+    
+    def available(self):
+        now = time.time()
+        return [session for session in self.sessions if session.cooldown_until <= now]
+    
+    def acquire(self):
+        """Берет сессию под запрос; после запроса обязателен release"""
+        available = self.available()
+        if not available:
+            raise SessionsCoolingDown(min(session.cooldown_until for session in self.sessions) - time.time())
+        start = next(self.turn) % len(available)
+        session = min(available[start:] + available[:start], key=lambda session: session.active)
+        session.active += 1
+        session.stats["requests"] += 1
+        return session
+    
+    def release(self, session: TelegramSession):
+        session.active -= 1
+    
+    def note_error(self, session: TelegramSession, error: Exception):
+        """Сессия в FloodWait выходит из ротации до конца ожидания"""
+        from telethon.errors import FloodWaitError
+        
+        if isinstance(error, FloodWaitError):
+            session.cooldown_until = max(session.cooldown_until, time.time() + error.seconds)
+            session.stats["flood_waits"] += 1
+            logger.warning(f"⏳ Session {session.name} in FloodWait for {error.seconds}s, out of rotation")
+    
+    def get_stats(self):
+        now = time.time()
+        return [
+            {
+                "name": session.name,
+                "active": session.active,
+                "cooldown": max(0, round(session.cooldown_until - now)),
+                **session.stats
+            }
+            for session in self.sessions
+        ]
+
+class TokenBucket:
+    """Токены на один тип RPC Telegram; ожидающие получают их по приоритету"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiters = []  # Куча (priority, seq, count, future)
+        self.seq = itertools.count()
+        self.task = None
+        self.waited = 0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def take(self, priority: int, count: int = 1):
+        """Ждет count токенов; rate 0 - без ограничения"""
+        if self.rate <= 0:
+            return
+        count = min(count, self.burst)
+        self._refill()
+        if not self.waiters and self.tokens >= count:
+            self.tokens -= count
+            return
+        self.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), count, future))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._drain())
+        await future
+    
+    async def _drain(self):
+        """Раздает токены по мере пополнения: сначала интерактивным, затем по очереди"""
+        while self.waiters:
+            _, _, count, future = self.waiters[0]
+            if future.done():
+                # Ожидающий отменен (например, истек дедлайн канала)
+                heapq.heappop(self.waiters)
+                continue
+            self._refill()
+            if self.tokens < count:
+                await asyncio.sleep((count - self.tokens) / self.rate)
+                continue
+            heapq.heappop(self.waiters)
+            self.tokens -= count
+            future.set_result(None)
+    
+    def get_stats(self):
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "waiting": len(self.waiters), "waited": self.waited}
+
+class TelegramScheduler:
+    """Через него идут все вызовы Telethon: лимиты по типам RPC, приоритеты, общий учет FloodWait"""
+    def __init__(self, pool: SessionPool):
+        self.pool = pool
+        self.buckets = {
+            "resolve": TokenBucket(TG_RATE_RESOLVE, TG_BURST_RESOLVE),
+            "history": TokenBucket(TG_RATE_HISTORY, TG_BURST_HISTORY),
+            "file": TokenBucket(TG_RATE_FILE, TG_BURST_FILE)
+        }
+        self.stats = {"flood_sleeps": 0, "flood_retries": 0}
+    
+    async def throttle(self, kind: str, priority: int, count: int = 1):
+        """Очередь перед RPC данного типа"""
+        await self.buckets[kind].take(priority, count)
+    
+    async def acquire(self, max_wait: float = TG_FLOOD_WAIT_MAX):
+        """Сессия под запрос. Если все в FloodWait - ждем, но не дольше max_wait"""
+        if not self.pool.sessions:
+            raise RuntimeError("No Telegram sessions connected")
+        while not self.pool.available():
+            wait = min(session.cooldown_until for session in self.pool.sessions) - time.time()
+            if wait > max_wait:
+                raise SessionsCoolingDown(wait)
+            self.stats["flood_sleeps"] += 1
+            logger.info(f"⏳ All Telegram sessions in FloodWait, waiting {wait:.0f}s")
+            await asyncio.sleep(max(wait, 0))
+        return self.pool.acquire()
+    
+    async def run(self, call, max_wait: float = TG_FLOOD_WAIT_MAX, hold: bool = False):
+        """call(session) на одной сессии; после FloodWait - повтор, а не ошибка
+        
+        hold - после успешного call сессия остается занятой, освобождает ее вызывающий
+        (сессия нужна, пока идет отданная клиенту загрузка).
+        """
+        from telethon.errors import FloodWaitError
+        
+        for attempt in range(TG_FLOOD_RETRIES + 1):
+            session = await self.acquire(max_wait)
+            held = False
+            try:
+                result = await call(session)
+                held = hold
+                return result
+            except FloodWaitError as e:
+                self.pool.note_error(session, e)
+                if attempt == TG_FLOOD_RETRIES:
+                    raise
+                self.stats["flood_retries"] += 1
+                logger.info(f"🔀 Retrying after FloodWait on {session.name}")
+            finally:
+                if not held:
+                    self.pool.release(session)
+    
+    def get_stats(self):
+        return {**self.stats, **{kind: bucket.get_stats() for kind, bucket in self.buckets.items()}}
+
 class TelegramClient:
     def __init__(self):
         self.api_id = os.getenv("TELEGRAM_API_ID")
         self.api_hash = os.getenv("TELEGRAM_API_HASH")
         self.session_string = os.getenv("TELEGRAM_SESSION")
-        self.client = None
+        self.session_specs = list(dict.fromkeys(
+            ([self.session_string] if self.session_string else []) + TELEGRAM_SESSIONS
+        ))
+        self.pool = SessionPool()
+        self.scheduler = TelegramScheduler(self.pool)
         self.connected = False
         self.connection_lock = asyncio.Lock()
-        self.cache = {}  # Кэш для постов
         self.cache_timeout = 300  # 5 минут
+        self.cache = PostCache(ttl=self.cache_timeout)  # Кэш для постов по каналам
+        self.inflight = {}  # Текущие загрузки: канал -> (limit, Task)
+        # Лимит одновременных загрузок из Telegram/хранилища; попадания в кэш и
+        # запросы, присоединившиеся к идущей загрузке, слотов не занимают
+        self.fetch_semaphore = asyncio.Semaphore(FEED_CONCURRENCY)
+        self.store = post_store
+        self.live = False  # События каналов приходят, опрос истории не нужен
+        self.live_session = None
+        self.live_channels = {}  # channel_id -> username
+        self.live_task = None
+        self.live_stats = {"new": 0, "edited": 0, "deleted": 0, "resyncs": 0}
+        self.stats = {
+            "fetches": 0, "coalesced": 0, "messages_fetched": 0, "entity_hits": 0, "entity_resolves": 0,
+            "counters_refreshed": 0
+        }
         
     async def connect(self):
         """Подключение к Telegram"""
@@ -64,44 +824,377 @@ class TelegramClient:
             if self.connected:
                 return True
                 
-            if not all([self.api_id, self.api_hash, self.session_string]):
+            if not all([self.api_id, self.api_hash]) or not self.session_specs:
                 logger.warning("❌ Telegram credentials not found - using demo mode")
                 logger.warning(f"📱 API ID: {self.api_id}")
                 logger.warning(f"📱 API Hash: {self.api_hash}")
                 logger.warning(f"📱 Session: {self.session_string}")
                 return False
-                
-            try:
-                from telethon import TelegramClient as TGClient
-                from telethon.sessions import StringSession
-                
-                logger.info("🔌 Creating Telegram client...")
-                self.client = TGClient(
-                    StringSession(self.session_string),
-                    int(self.api_id),
-                    self.api_hash
-                )
-                
-                logger.info("🔌 Starting Telegram client...")
-                await self.client.start()
-                self.connected = True
-                logger.info("✅ Telegram client connected successfully!")
-                return True
-            except Exception as e:
-                logger.error(f"❌ Failed to connect to Telegram: {e}")
-                logger.error(f"❌ Error type: {type(e).__name__}")
-                logger.error(f"❌ Error details: {str(e)}")
+            
+            logger.info(f"🔌 Starting {len(self.session_specs)} Telegram session(s)...")
+            results = await asyncio.gather(*[
+                self._start_session(index, spec) for index, spec in enumerate(self.session_specs)
+            ])
+            self.pool.sessions = [session for session in results if session is not None]
+            if not self.pool.sessions:
                 self.connected = False
                 return False
+            self.connected = True
+            logger.info(f"✅ Telegram client connected successfully with {len(self.pool.sessions)} session(s)!")
+            return True
+    
+    async def _start_session(self, index: int, spec: str):
+        """Подключение одной сессии пула; неавторизованная сессия пропускается"""
+        try:
+            from telethon import TelegramClient as TGClient
+            from telethon.sessions import StringSession
+            
+            if spec.endswith(".session"):
+                # Telethon сам добавляет расширение к имени файловой сессии
+                name, session = os.path.basename(spec), spec[:-len(".session")]
+            else:
+                name, session = f"string_{index}", StringSession(spec)
+            client = TGClient(session, int(self.api_id), self.api_hash, flood_sleep_threshold=TELEGRAM_FLOOD_SLEEP)
+            
+            # connect, а не start: start спрашивает телефон в консоли, если сессия не авторизована
+            await client.connect()
+            if not await client.is_user_authorized():
+                logger.error(f"❌ Telegram session {name} is not authorized, skipping")
+                await client.disconnect()
+                return None
+            
+            me = await client.get_me(input_peer=True)
+            session = TelegramSession(name, client)
+            session.account = me.user_id
+            await self._load_entities(session)
+            logger.info(f"✅ Telegram session {name} connected")
+            return session
+        except Exception as e:
+            logger.error(f"❌ Failed to connect to Telegram: {e}")
+            logger.error(f"❌ Error type: {type(e).__name__}")
+            logger.error(f"❌ Error details: {str(e)}")
+            return None
+    
+    async def _load_entities(self, session: TelegramSession):
+        """Поднимаем кэш entity каналов сессии из хранилища"""
+        from telethon.tl.types import InputPeerChannel
+        
+        try:
+            stored = await self.store.load_entities(session.account)
+        except Exception as e:
+            logger.error(f"❌ Failed to load entity cache: {e}")
+            return
+        session.entities = {
+            username: InputPeerChannel(peer_id, access_hash)
+            for username, (peer_id, access_hash) in stored.items()
+        }
+        logger.info(f"📇 Loaded {len(session.entities)} cached channel entities for {session.name}")
+    
+    async def resolve_entity(self, channel_username: str, session: TelegramSession, priority: int = PRIORITY_INTERACTIVE):
+        """InputPeer канала для сессии: из кэша или одним ResolveUsername с сохранением"""
+        from telethon.tl.types import InputPeerChannel
+        from telethon.utils import get_input_peer
+        
+        key = channel_username.lower()
+        peer = session.entities.get(key)
+        if peer is not None:
+            self.stats["entity_hits"] += 1
+            return peer
+        
+        await self.scheduler.throttle("resolve", priority)
+        entity = await session.client.get_entity(channel_username)
+        self.stats["entity_resolves"] += 1
+        logger.info(f"✅ Found channel: {getattr(entity, 'title', channel_username)}")
+        peer = get_input_peer(entity)
+        if isinstance(peer, InputPeerChannel):
+            session.entities[key] = peer
+            try:
+                await self.store.save_entity(session.account, key, peer.channel_id, peer.access_hash)
+            except Exception as e:
+                logger.error(f"❌ Failed to persist entity for {channel_username}: {e}")
+        return peer
+    
+    async def invalidate_entity(self, channel_username: str):
+        """Сбрасываем кэш entity во всех сессиях (например, канал переименован)"""
+        key = channel_username.lower()
+        removed = False
+        for session in self.pool.sessions:
+            removed = session.entities.pop(key, None) is not None or removed
+        await self.store.delete_entity(key)
+        logger.info(f"🗑️ Invalidated cached entity for {channel_username}")
+        return removed
+    
+    async def invalidate_on_peer_error(self, channel_username: str, error: Exception):
+        """Закэшированный peer больше не работает - сбрасываем его"""
+        from telethon.errors import ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError
+        
+        if isinstance(error, (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError)):
+            try:
+                await self.invalidate_entity(channel_username)
+            except Exception as e:
+                logger.error(f"❌ Failed to invalidate entity for {channel_username}: {e}")
+    
+    async def disconnect(self):
+        """Отключение от Telegram"""
+        async with self.connection_lock:
+            if self.live_task is not None:
+                self.live_task.cancel()
+                self.live_task = None
+            self.live = False
+            for session in self.pool.sessions:
+                await session.client.disconnect()
+            self.pool.sessions = []
+            self.connected = False
     
     async def get_channel_posts(self, channel_username: str, limit: int = 10):
         """Получение реальных постов из канала с кэшированием"""
-        # Проверяем кэш
-        cache_key = f"{channel_username}_{limit}"
-        if cache_key in self.cache:
-            cache_time, posts = self.cache[cache_key]
-            if time.time() - cache_time < self.cache_timeout:
+        # Проверяем кэш: окно канала отвечает на любой limit не больше своего размера
+        cached = self.cache.get(channel_username, limit)
+        if cached is not None:
+            posts, stale = cached
+            if stale:
+                # Отдаем устаревшие посты сразу, а обновляем в фоне
+                logger.info(f"♻️ Serving stale posts for {channel_username}, refreshing in background")
+                if channel_username not in self.inflight:
+                    self._start_fetch(
+                        channel_username, self.cache.entries[channel_username].window,
+                        priority=PRIORITY_BACKGROUND
+                    )
+            else:
                 logger.info(f"📦 Using cached posts for {channel_username}")
+            return posts
+        
+        # shield: отмена одного из ожидающих не должна отменять загрузку для остальных
+        posts = await asyncio.shield(self._start_fetch(channel_username, limit))
+        return posts[:limit]
+    
+    async def refresh_channel(self, channel_username: str, limit: int, priority: int = PRIORITY_BACKGROUND):
+        """Принудительное обновление окна канала независимо от свежести кэша"""
+        entry = self.cache.entries.get(channel_username)
+        if entry is not None:
+            limit = max(limit, entry.window)
+        return await asyncio.shield(self._start_fetch(channel_username, limit, force=True, priority=priority))
+    
+    def _start_fetch(self, channel_username: str, limit: int, force: bool = False,
+                     priority: int = PRIORITY_INTERACTIVE):
+        """Запускает загрузку канала или возвращает уже идущую с достаточным limit"""
+        inflight = self.inflight.get(channel_username)
+        if inflight is not None and inflight[0] >= limit:
+            self.stats["coalesced"] += 1
+            logger.info(f"🔗 Joining in-flight fetch for {channel_username}")
+            return inflight[1]
+        
+        task = asyncio.ensure_future(self._fetch_limited(channel_username, limit, force, priority))
+        self.inflight[channel_username] = (limit, task)
+        task.add_done_callback(lambda t: self._finish_inflight(channel_username, t))
+        self.stats["fetches"] += 1
+        return task
+    
+    async def _fetch_limited(self, channel_username: str, limit: int, force: bool, priority: int):
+        """Новая загрузка канала под общим лимитом FEED_CONCURRENCY"""
+        async with self.fetch_semaphore:
+            return await self._fetch_channel_posts(channel_username, limit, force, priority)
+    
+    def _finish_inflight(self, channel_username: str, task):
+        """Снимаем завершенную загрузку с регистрации"""
+        inflight = self.inflight.get(channel_username)
+        if inflight is not None and inflight[1] is task:
+            del self.inflight[channel_username]
+    
+    def get_stats(self):
+        """Счетчики загрузок, объединенных запросов и кэша"""
+        return {
+            **self.stats,
+            "inflight": len(self.inflight),
+            "cache": self.cache.get_stats(),
+            "sessions": self.pool.get_stats(),
+            "scheduler": self.scheduler.get_stats(),
+            "live": {"active": self.live, "channels": len(self.live_channels), **self.live_stats}
+        }
+    
+    def is_live(self, channel_username: str):
+        """Приходят ли события канала (аккаунт live-сессии в нем состоит и соединение есть)"""
+        return self.live and channel_username in self.live_channels.values()
+    
+    def _cache_ttl(self, channel_username: str):
+        """Пока канал получает события, окно в кэше остается свежим дольше"""
+        return LIVE_CACHE_TTL if self.is_live(channel_username) else None
+    
+    async def start_live(self, channels, window: int):
+        """Подписка на NewMessage/MessageEdited/MessageDeleted рабочих каналов через одну сессию пула
+        
+        Telegram присылает обновления каналов только подписчикам, поэтому live включается
+        лишь для каналов, в которых состоит аккаунт первой сессии; остальные опрашиваются как раньше.
+        """
+        if not LIVE_UPDATES_ENABLED or self.live_task is not None or not self.pool.sessions:
+            return
+        from telethon import events
+        
+        session = self.pool.sessions[0]
+        peers = []
+        for channel_username in channels:
+            try:
+                peer = await self.resolve_entity(channel_username, session, PRIORITY_BACKGROUND)
+                # Публичный канал резолвится и без вступления - проверяем, что аккаунт в нем состоит
+                await self.scheduler.throttle("history", PRIORITY_BACKGROUND)
+                channel = await session.client.get_entity(peer)
+                if getattr(channel, "left", True):
+                    logger.warning(f"📡 {session.name} is not a member of {channel_username}, polling it instead")
+                    continue
+                self.live_channels[peer.channel_id] = channel_username
+                peers.append(peer)
+            except Exception as e:
+                logger.error(f"❌ Live updates unavailable for {channel_username}: {e}")
+        if not self.live_channels:
+            return
+        
+        session.client.add_event_handler(self._on_new_message, events.NewMessage(chats=peers))
+        session.client.add_event_handler(self._on_message_edited, events.MessageEdited(chats=peers))
+        session.client.add_event_handler(self._on_message_deleted, events.MessageDeleted(chats=peers))
+        self.live_session = session
+        self.live = True
+        self.live_task = asyncio.create_task(self._watch_live(session, window))
+        logger.info(f"📡 Live updates for {len(self.live_channels)} channels via {session.name}")
+    
+    async def _on_new_message(self, event):
+        await self._apply_live_message(event.message, "new")
+    
+    async def _on_message_edited(self, event):
+        await self._apply_live_message(event.message, "edited")
+    
+    async def _on_message_deleted(self, event):
+        """Удаленные в канале сообщения убираем из хранилища и окна кэша"""
+        channel_username = self.live_channels.get(getattr(event.original_update, "channel_id", None))
+        if channel_username is None:
+            return
+        self.live_stats["deleted"] += 1
+        try:
+            await self.store.delete(channel_username, event.deleted_ids)
+            if await self._reload_window(channel_username):
+                logger.info(f"📡 Live deleted messages {event.deleted_ids} in {channel_username}")
+        except Exception as e:
+            logger.error(f"❌ Failed to apply live update for {channel_username}: {e}")
+    
+    async def _apply_live_message(self, message, kind: str):
+        """Сообщение из события - в хранилище и окно кэша, без запросов к Telegram"""
+        channel_username = self.live_channels.get(getattr(message.peer_id, "channel_id", None))
+        if channel_username is None:
+            return
+        self.live_stats[kind] += 1
+        try:
+            await self.store.upsert(channel_username, [PostStore.message_to_row(message)])
+            if await self._reload_window(channel_username):
+                logger.info(f"📡 Live {kind} message {message.id} in {channel_username}")
+        except Exception as e:
+            logger.error(f"❌ Failed to apply live update for {channel_username}: {e}")
+    
+    async def _reload_window(self, channel_username: str, keep_fetched_at: bool = False):
+        """Перечитываем окно канала из хранилища после точечных изменений
+        
+        Новая версия окна - только если изменилась лента (посты ниже порога просмотров в нее не входят).
+        keep_fetched_at - новых сообщений не загружали, срок свежести окна не продлеваем.
+        """
+        entry = self.cache.entries.get(channel_username)
+        if entry is None:
+            return False
+        posts = await self.store.latest(channel_username, entry.window)
+        if posts == entry.posts:
+            return False
+        self.cache.put(
+            channel_username, posts, window=entry.window, ttl=self._cache_ttl(channel_username),
+            fetched_at=entry.fetched_at if keep_fetched_at else None
+        )
+        return True
+    
+    async def refresh_counters(self, channel_username: str):
+        """Просмотры, реакции и комментарии сообщений окна канала пакетами, без загрузки сообщений
+        
+        Берем все сохраненные id от самого старого поста окна: окно растет до FEED_MAX_WINDOW
+        при глубоком листании, и посты ниже порога просмотров тоже могут в него войти.
+        """
+        entry = self.cache.entries.get(channel_username)
+        if entry is None or not entry.posts:
+            return 0
+        ids = await self.store.ids_from(channel_username, entry.posts[-1]['message_id'])
+        if not ids:
+            return 0
+        rows = []
+        for start in range(0, len(ids), COUNTER_REFRESH_IDS):
+            chunk = ids[start:start + COUNTER_REFRESH_IDS]
+            rows += await self.scheduler.run(lambda session: self._fetch_counters(channel_username, session, chunk))
+        await self.store.update_counters(channel_username, rows)
+        self.stats["counters_refreshed"] += len(rows)
+        await self._reload_window(channel_username, keep_fetched_at=True)
+        return len(rows)
+    
+    async def _fetch_counters(self, channel_username: str, session: TelegramSession, ids):
+        """GetMessagesViews + GetMessagesReactions: строки для PostStore.update_counters"""
+        from telethon.tl.functions.messages import GetMessagesReactionsRequest, GetMessagesViewsRequest
+        from telethon.tl.types import UpdateMessageReactions
+        
+        entity = await self.resolve_entity(channel_username, session, PRIORITY_BACKGROUND)
+        await self.scheduler.throttle("history", PRIORITY_BACKGROUND, count=2)
+        # Ответ приходит в порядке запрошенных id; increment=False - не накручиваем просмотры
+        result = await session.client(GetMessagesViewsRequest(peer=entity, id=ids, increment=False))
+        counters = {
+            message_id: [item.views, None, item.replies.replies if item.replies else None]
+            for message_id, item in zip(ids, result.views)
+        }
+        reactions = await session.client(GetMessagesReactionsRequest(peer=entity, id=ids))
+        for update in reactions.updates:
+            if isinstance(update, UpdateMessageReactions) and update.msg_id in counters:
+                counters[update.msg_id][1] = PostStore.reaction_count(update.reactions)
+        return [(views, likes, comments, message_id) for message_id, (views, likes, comments) in counters.items()]
+    
+    async def _watch_live(self, session: TelegramSession, window: int):
+        """Следим за соединением live-сессии: пока его нет - опрос, после переподключения - досинхронизация"""
+        while True:
+            await asyncio.sleep(LIVE_CHECK_INTERVAL)
+            connected = session.client.is_connected()
+            if self.live and not connected:
+                logger.warning("📡 Live updates lost, falling back to polling")
+                self.live = False
+                # Окна, продленные на время live-обновлений, снова обновляются по обычному TTL
+                now = time.time()
+                for channel_username in self.live_channels.values():
+                    entry = self.cache.entries.get(channel_username)
+                    if entry is not None:
+                        entry.fresh_until = min(entry.fresh_until, now)
+            elif not self.live and connected:
+                # События, пропущенные без соединения, забираем одной инкрементальной синхронизацией
+                logger.info("📡 Live updates reconnected, resyncing channels")
+                self.live = True
+                self.live_stats["resyncs"] += 1
+                await asyncio.gather(*[
+                    self.refresh_channel(channel_username, window)
+                    for channel_username in self.live_channels.values()
+                ], return_exceptions=True)
+    
+    async def _fetch_channel_posts(self, channel_username: str, limit: int, force: bool = False,
+                                   priority: int = PRIORITY_INTERACTIVE):
+        """Загрузка постов из Telegram (одна на все одновременные запросы)
+        
+        Если окно канала в кэше еще свежее и просто мало (глубокая страница ленты),
+        новые сообщения не синхронизируем - только добираем старые из хранилища.
+        force - синхронизировать в любом случае (прогрев).
+        priority - очередь планировщика: пользователи раньше фонового обновления.
+        """
+        entry = self.cache.entries.get(channel_username)
+        extend_only = not force and entry is not None and time.time() < entry.fresh_until
+        fetched_at = entry.fetched_at if extend_only else None
+        if extend_only:
+            try:
+                posts = await self.store.latest(channel_username, limit)
+                _, _, stored = await self.store.bounds(channel_username)
+            except Exception as e:
+                logger.error(f"❌ Post store error for {channel_username}: {e}")
+                posts, stored = [], 0
+            if len(posts) >= limit or stored >= limit*5:
+                # Хранилищу хватает глубины - Telegram не нужен
+                self.cache.put(
+                    channel_username, posts, window=limit,
+                    ttl=self._cache_ttl(channel_username), fetched_at=fetched_at
+                )
                 return posts
         
         logger.info(f"🔍 Fetching real posts from {channel_username}")
@@ -109,55 +1202,100 @@ class TelegramClient:
         # Подключаемся если еще не подключены
         logger.info(f"🔌 Attempting to connect to Telegram...")
         if not await self.connect():
-            logger.warning(f"📱 Telegram not connected, using demo for {channel_username}")
-            return self._get_demo_posts(channel_username, limit)
+            logger.warning(f"📱 Telegram not connected, using stored/demo posts for {channel_username}")
+            return await self._get_fallback_posts(channel_username, limit)
         
         try:
             logger.info(f"🔍 Fetching real posts from {channel_username}")
-            posts = []
-            
-            # Получаем entity канала
-            try:
-                entity = await self.client.get_entity(channel_username)
-                logger.info(f"✅ Found channel: {entity.title}")
-            except Exception as e:
-                logger.error(f"❌ Channel {channel_username} not found: {e}")
-                return self._get_demo_posts(channel_username, limit)
-            
-            # Получаем сообщения
-            message_count = 0
-            async for message in self.client.iter_messages(entity, limit=limit*5):
-                if message.views and message.views >= 500:  # Минимум 500 просмотров
-                    post_data = {
-                        'id': f"{channel_username}_{message.id}",
-                        'channel': channel_username,
-                        'message_id': message.id,
-                        'text': (message.text or "No text")[:200],
-                        'views': message.views or 0,
-                        'likes': getattr(message.reactions, 'count', 0) if message.reactions else 0,
-                        'comments': message.replies.replies if message.replies else 0,
-                        'date': message.date.isoformat(),
-                        'media_url': f"/photo/{channel_username}/{message.id}" if message.photo else "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop",
-                        'post_url': f"https://t.me/{channel_username}/{message.id}"
-                    }
-                    posts.append(post_data)
-                    message_count += 1
-                    logger.info(f"📄 Found post {message.id} with {message.views} views")
-                    
-                    if message_count >= limit:
-                        break
             
+            # Вся синхронизация канала - через одну сессию: entity действителен только для своего аккаунта
+            posts = await self.scheduler.run(
+                lambda session: self._sync_channel(channel_username, session, limit, extend_only, priority)
+            )
             logger.info(f"✅ Retrieved {len(posts)} real posts from {channel_username}")
             
             # Сохраняем в кэш
-            self.cache[cache_key] = (time.time(), posts)
+            self.cache.put(
+                channel_username, posts, window=limit,
+                ttl=self._cache_ttl(channel_username), fetched_at=fetched_at
+            )
             logger.info(f"📦 Cached {len(posts)} posts for {channel_username}")
             
             return posts
             
         except Exception as e:
             logger.error(f"❌ Error getting posts from {channel_username}: {e}")
-            return self._get_demo_posts(channel_username, limit)
+            await self.invalidate_on_peer_error(channel_username, e)
+            return await self._get_fallback_posts(channel_username, limit)
+    
+    async def _sync_channel(self, channel_username: str, session: TelegramSession, limit: int,
+                            extend_only: bool, priority: int):
+        """Синхронизация канала в хранилище и последние limit постов"""
+        # Получаем entity канала (из кэша, если уже знаем)
+        try:
+            entity = await self.resolve_entity(channel_username, session, priority)
+        except Exception as e:
+            logger.error(f"❌ Channel {channel_username} not found: {e}")
+            raise
+        
+        min_id, max_id, stored = await self.store.bounds(channel_username)
+        if not max_id:
+            # Первая загрузка канала
+            await self._sync_messages(channel_username, session, entity, priority, limit=limit*5)
+            min_id, max_id, stored = await self.store.bounds(channel_username)
+        elif not extend_only:
+            # Инкрементальная синхронизация: только новые сообщения
+            # плюс последние POST_STORE_RESCAN id ради свежих просмотров/реакций.
+            # Пачками от новых к старым до самого rescan_from: после простоя новых сообщений
+            # может быть больше одной пачки, и без этого между пачкой и max_id осталась бы дыра
+            rescan_from = max(0, max_id - POST_STORE_RESCAN)
+            batch = limit*5 + POST_STORE_RESCAN
+            offset_id = 0
+            seen_ids = []
+            while True:
+                rows = await self._sync_messages(
+                    channel_username, session, entity, priority,
+                    min_id=rescan_from, offset_id=offset_id, limit=batch
+                )
+                seen_ids += [row[0] for row in rows]
+                if len(rows) < batch:
+                    break
+                offset_id = min(row[0] for row in rows)
+            # Все id новее rescan_from Telegram только что вернул: чего среди них нет - удалено в канале
+            await self.store.delete_missing(channel_username, rescan_from, seen_ids)
+        
+        posts = await self.store.latest(channel_username, limit)
+        if len(posts) < limit and min_id and stored < limit*5:
+            # Постов не хватает, а вглубь канал еще не просмотрен на limit*5 сообщений
+            await self._sync_messages(
+                channel_username, session, entity, priority, offset_id=min_id, limit=limit*5 - stored
+            )
+            posts = await self.store.latest(channel_username, limit)
+        return posts
+    
+    async def _sync_messages(self, channel_username: str, session: TelegramSession, entity, priority: int, **kwargs):
+        """Загружаем сообщения из Telegram в хранилище, возвращаем их строки"""
+        # iter_messages запрашивает историю пачками по 100 сообщений
+        await self.scheduler.throttle("history", priority, count=-(-kwargs.get("limit", 100) // 100))
+        rows = []
+        async for message in session.client.iter_messages(entity, **kwargs):
+            rows.append(PostStore.message_to_row(message))
+        await self.store.upsert(channel_username, rows)
+        self.stats["messages_fetched"] += len(rows)
+        logger.info(f"💾 Synced {len(rows)} messages from {channel_username} via {session.name}")
+        return rows
+    
+    async def _get_fallback_posts(self, channel_username: str, limit: int):
+        """Сохраненные посты, если они есть, иначе демо данные"""
+        try:
+            posts = await self.store.latest(channel_username, limit)
+        except Exception as e:
+            logger.error(f"❌ Post store error for {channel_username}: {e}")
+            posts = []
+        if posts:
+            logger.info(f"💾 Using {len(posts)} stored posts for {channel_username}")
+            return posts
+        return self._get_demo_posts(channel_username, limit)
     
     def _get_demo_posts(self, channel_username: str, limit: int):
         """Демо данные как fallback"""
@@ -186,170 +1324,1260 @@ class TelegramClient:
             posts.append(post_data)
         return posts
 
+class CacheWarmer:
+    """Прогрев кэша всех рабочих каналов при старте и по расписанию"""
+    def __init__(self, client: TelegramClient, interval: float, jitter: float, window: int):
+        self.client = client
+        self.interval = interval
+        self.jitter = jitter
+        self.window = window
+        self.task = None
+        self.ready = False
+        self.mode = "starting"
+        self.warmed = set()
+        self.last_run = None
+    
+    def channels(self):
+        """Все каналы из WORKING_CHANNELS без повторов"""
+        return list(dict.fromkeys(ch for chans in WORKING_CHANNELS.values() for ch in chans))
+    
+    def start(self):
+        if WARMER_ENABLED and self.task is None:
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def _run(self):
+        logger.info("🔥 Cache warmer started")
+        while True:
+            try:
+                await self.warm_all()
+            except Exception as e:
+                logger.error(f"❌ Cache warming failed: {e}")
+            # Пока live-обновления приходят по всем каналам, прогрев только страхует от пропусков
+            live = all(self.client.is_live(channel) for channel in self.channels())
+            interval = WARMER_LIVE_INTERVAL if live else self.interval
+            # Случайный разброс, чтобы несколько инстансов не ходили в Telegram одновременно
+            delay = interval * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(delay)
+    
+    async def warm_all(self):
+        """Загружаем окна всех каналов параллельно"""
+        if not await self.client.connect():
+            # Без Telegram прогревать нечего - работаем на демо данных
+            self.mode = "demo"
+            self.ready = True
+            return
+        
+        self.mode = "telegram"
+        channels = self.channels()
+        started = time.perf_counter()
+        # Подписка до прогрева: окна сразу кэшируются на время live-обновлений
+        await self.client.start_live(channels, self.window)
+        await asyncio.gather(*[
+            self.client.refresh_channel(channel, self.window) for channel in channels
+        ], return_exceptions=True)
+        # Демо-фолбэк в кэш не попадает, поэтому прогретыми считаем только закэшированные каналы
+        self.warmed = {channel for channel in channels if channel in self.client.cache.entries}
+        self.last_run = time.time()
+        # Один канал, который не грузится (например, переименован), не должен держать /ready в 503 навсегда
+        self.ready = self.ready or len(self.warmed) >= WARMER_READY_RATIO * len(channels)
+        logger.info(f"🔥 Warmed {len(self.warmed)}/{len(channels)} channels in {time.perf_counter() - started:.1f}s")
+    
+    def get_status(self):
+        channels = self.channels()
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "live": self.client.live,
+            "warmed": sorted(self.warmed),
+            "failed": sorted(set(channels) - self.warmed) if self.last_run else [],
+            "channels": len(channels),
+            "last_run": datetime.fromtimestamp(self.last_run).isoformat() if self.last_run else None
+        }
+
+class CounterRefresher:
+    """Фоновое обновление счетчиков закэшированных каналов: ранжирование по просмотрам остается актуальным"""
+    def __init__(self, client: TelegramClient, interval: float):
+        self.client = client
+        self.interval = interval
+        self.task = None
+        self.last_run = None
+    
+    def start(self):
+        if COUNTER_REFRESH_ENABLED and self.task is None:
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Подключается прогрев или первый запрос ленты - сами в Telegram не ходим
+            if not self.client.connected:
+                continue
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.error(f"❌ Counter refresh failed: {e}")
+    
+    async def refresh_all(self):
+        """Счетчики всех каналов, окна которых сейчас в кэше"""
+        channels = list(self.client.cache.entries)
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            self.client.refresh_counters(channel) for channel in channels
+        ], return_exceptions=True)
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Failed to refresh counters for {channel}: {result}")
+        self.last_run = time.time()
+        refreshed = sum(result for result in results if isinstance(result, int))
+        logger.info(f"📊 Refreshed counters of {refreshed} posts in {time.perf_counter() - started:.1f}s")
+
 # Создаем экземпляр клиента
 telegram_client = TelegramClient()
+cache_warmer = CacheWarmer(telegram_client, WARMER_INTERVAL, WARMER_JITTER, FEED_CHANNEL_WINDOW)
+counter_refresher = CounterRefresher(telegram_client, COUNTER_REFRESH_INTERVAL)
+
+async def _fetch_channel_timed(channel: str, limit: int):
+    """Загрузка канала с дедлайном и замером времени"""
+    started = time.perf_counter()
+    try:
+        # Загрузка идет под shield и продолжается после дедлайна
+        posts = await asyncio.wait_for(telegram_client.get_channel_posts(channel, limit=limit), FEED_CHANNEL_TIMEOUT)
+        status = "ok"
+    except asyncio.TimeoutError:
+        # Загрузка продолжается в фоне (например, ждет в очереди планировщика) и заполнит кэш
+        # для следующих запросов; пока отдаем то, что уже есть в хранилище
+        logger.warning(f"⏱️ Channel {channel} missed the {FEED_CHANNEL_TIMEOUT}s deadline")
+        try:
+            posts = await post_store.latest(channel, limit)
+        except Exception as e:
+            logger.error(f"❌ Post store error for {channel}: {e}")
+            posts = []
+        status = "timeout"
+    except Exception as e:
+        logger.error(f"❌ Error getting posts from {channel}: {e}")
+        posts, status = [], "error"
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return channel, posts, {"status": status, "elapsed_ms": elapsed_ms, "count": len(posts)}
 
 @app.get("/")
 async def root():
     """Главная страница"""
     return {"message": "Creative MVP - Real Telegram Data", "status": "running"}
 
+@app.get("/ready")
+async def ready():
+    """Готовность: завершен ли проход прогрева кэша (каналы, которые не прогрелись - в failed)"""
+    status = cache_warmer.get_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+def _encode_cursor(state):
+    raw = json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    """Курсор: t - ярус ленты, k - [views, channel, message_id] последнего поста страницы
+    (null - ярус начинается с начала), b - {канал: [hi, lo]}: посты канала в ярусе -
+    lo <= message_id < hi (hi 0 - без верхней границы, lo null - еще не закреплена)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        tier = int(state["t"])
+        after = None
+        if state["k"] is not None:
+            views, channel, message_id = state["k"]
+            after = (-int(views), str(channel), -int(message_id))
+        bands = {
+            str(ch): [int(hi), None if lo is None else int(lo)]
+            for ch, (hi, lo) in state["b"].items()
+        }
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    # Курсор не подписан: ярус и id проверяем, чтобы не запросить окно глубже FEED_MAX_WINDOW
+    ids = [value for band in bands.values() for value in band if value is not None]
+    if after is not None:
+        ids += [-after[0], -after[2]]
+    if not 0 <= tier < FEED_MAX_WINDOW // FEED_CHANNEL_WINDOW or any(value < 0 for value in ids):
+        raise HTTPException(400, "Invalid cursor")
+    return tier, after, bands
+
+# Версии каналов - счетчики процесса, поэтому в ETag входит id запуска:
+# после рестарта или на другом инстансе старый ETag не совпадет
+FEED_ETAG_SALT = uuid.uuid4().hex
+
+def _feed_etag(memo_key, versions):
+    """Слабый ETag страницы по версиям окон каналов; None, если окна не все из кэша"""
+    if None in versions:
+        return None
+    digest = hashlib.blake2b(repr((FEED_ETAG_SALT, memo_key, versions)).encode("utf-8"), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+def _etag_matches(if_none_match: str, etag: str):
+    """Сравнение If-None-Match со слабым ETag (W/ при сравнении не учитывается)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+class EncodedPage:
+    """Готовые байты JSON страницы ленты; сжатые варианты считаются при первом запросе"""
+    __slots__ = ("body", "count", "compressed")
+    
+    def __init__(self, payload, count: int):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.count = count
+        self.compressed = {}  # content-encoding -> байты
+    
+    def encoded(self, accept_encoding: str):
+        """(байты, content-encoding или None) под Accept-Encoding клиента"""
+        if len(self.body) < FEED_COMPRESS_MIN_BYTES:
+            return self.body, None
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding not in accepted or (encoding == "br" and brotli is None):
+                continue
+            data = self.compressed.get(encoding)
+            if data is None:
+                data = brotli.compress(self.body, quality=5) if encoding == "br" else gzip.compress(self.body, 6)
+                self.compressed[encoding] = data
+            return data, encoding
+        return self.body, None
+
+def _accepted_encodings(accept_encoding: str):
+    """Кодировки из Accept-Encoding, кроме явно запрещенных q=0"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.lower())
+    return accepted
+
+feed_page_memo = OrderedDict()  # (category, limit, cursor) -> (версии каналов, EncodedPage)
+
+def _tier_floor(band):
+    """message_id, до которого окно канала должно дойти для яруса [hi, lo]; None - без ограничения"""
+    hi, lo = band
+    if lo is not None:
+        return lo
+    return hi - 1 if hi else None
+
+async def _fetch_tier(channels, tier: int, bands):
+    """Окна каналов для яруса ленты и посты каждого канала в границах яруса
+    
+    Лента упорядочена по просмотрам, а окна каналов растут по свежести, поэтому страницы
+    идут ярусами: ярус t - посты из (t+1)*FEED_CHANNEL_WINDOW последних, которых не было
+    в ярусах выше. Следующий ярус начинается, только когда текущий выдан целиком,
+    иначе более старые посты с большими просмотрами оказались бы до курсора и пропали.
+    Границы яруса закрепляются по message_id: новые посты каналов его не сдвигают.
+    """
+    depths = {channel: min((tier + 1) * FEED_CHANNEL_WINDOW, FEED_MAX_WINDOW) for channel in channels}
+    while True:
+        results = await asyncio.gather(*[
+            _fetch_channel_timed(channel, depths[channel]) for channel in channels
+        ])
+        # С начала листания в канале появились новые посты - окно углубляем, пока оно не дойдет
+        # до закрепленной нижней границы яруса (или хотя бы ниже верхней, если ярус только начинается)
+        short = [
+            channel for channel, posts, _ in results
+            if posts and len(posts) >= depths[channel] < FEED_MAX_WINDOW
+            and _tier_floor(bands.get(channel, [0, None])) is not None
+            and min(post['message_id'] for post in posts) > _tier_floor(bands[channel])
+        ]
+        if not short:
+            break
+        for channel in short:
+            depths[channel] = min(depths[channel] + FEED_CHANNEL_WINDOW, FEED_MAX_WINDOW)
+    
+    tier_bands = {}
+    band_lists = []
+    versions = []
+    channel_stats = {}
+    more = False
+    for channel, posts, stats in results:
+        channel_stats[channel] = stats
+        # Окно из кэша уже отсортировано; демо, сохраненные посты и ответы по дедлайну кэша не имеют
+        ranked = telegram_client.cache.ranked(channel, depths[channel]) if stats["status"] == "ok" else None
+        if ranked is None:
+            ranked = (None, sorted(posts, key=_feed_sort_key))
+        versions.append(ranked[0])
+        hi, lo = bands.get(channel, [0, None])
+        if lo is None:
+            # Нижняя граница не выше верхней: иначе ярус захватил бы уже показанные посты
+            lo = min((post['message_id'] for post in posts), default=hi)
+            if hi:
+                lo = min(lo, hi)
+        tier_bands[channel] = [hi, lo]
+        # Следующий ярус нужен, если ниже границы уже есть посты или окно заполнено и глубже могут быть еще
+        more = (
+            more or any(post['message_id'] < lo for post in posts)
+            or len(posts) >= depths[channel] < FEED_MAX_WINDOW
+        )
+        band_lists.append([
+            post for post in ranked[1]
+            if post['message_id'] >= lo and (not hi or post['message_id'] < hi)
+        ])
+    return tier_bands, band_lists, versions, channel_stats, more
+
+def _merge_tier(band_lists, after, limit: int):
+    """k-way слияние отсортированных постов яруса: O(limit log k) вместо полной сортировки.
+    (страница, сколько постов яруса осталось начиная с этой страницы)"""
+    streams = []
+    remaining = 0
+    for band in band_lists:
+        # Пропускаем то, что уже было на прошлых страницах яруса
+        start = bisect.bisect_right(band, after, key=_feed_sort_key) if after is not None else 0
+        remaining += len(band) - start
+        streams.append(itertools.islice(band, start, None))
+    return list(itertools.islice(heapq.merge(*streams, key=_feed_sort_key), limit)), remaining
+
 @app.get("/telegram/channels/{category}")
-async def get_channel_posts(category: str, limit: int = 25):
-    """Получение постов из канала"""
+async def get_channel_posts(request: Request, category: str,
+                            limit: int = Query(25, ge=1, le=FEED_MAX_LIMIT), cursor: str = None):
+    """Получение постов из канала (cursor - из next_cursor предыдущей страницы)"""
     logger.info(f"📱 Getting posts for category: {category}")
     
     if category not in WORKING_CHANNELS:
         return {"error": "Invalid category", "posts": []}
     
-    all_posts = []
-    for channel in WORKING_CHANNELS[category]:
-        try:
-            posts = await telegram_client.get_channel_posts(
-                channel, 
-                limit=limit//len(WORKING_CHANNELS[category])
-            )
-            all_posts.extend(posts)
-        except Exception as e:
-            logger.error(f"❌ Error getting posts from {channel}: {e}")
-            continue
+    tier, after, bands = _decode_cursor(cursor) if cursor else (0, None, {})
+    channels = WORKING_CHANNELS[category]
+    
+    # Страница набирается из яруса курсора; если он кончился, продолжаем следующим, более глубоким.
+    # Окна каналов - кратные FEED_CHANNEL_WINDOW, так что разные limit попадают в одни и те же окна,
+    # а следующие страницы берутся из кэша/хранилища без перечитывания прошлых из Telegram
+    posts = []
+    total = 0
+    versions = []
+    channel_stats = {}
+    partial = False
+    next_state = None
+    while True:
+        tier_bands, band_lists, tier_versions, tier_stats, more = await _fetch_tier(channels, tier, bands)
+        versions.extend(tier_versions)
+        channel_stats.update(tier_stats)
+        partial = partial or any(stats["status"] != "ok" for stats in tier_stats.values())
+        
+        page_part, remaining = _merge_tier(band_lists, after, limit - len(posts))
+        posts.extend(page_part)
+        total += remaining
+        if remaining > len(page_part):
+            # Ярус не исчерпан - следующая страница продолжит его с последнего поста
+            last = posts[-1]
+            next_state = {"t": tier, "k": [last['views'], last['channel'], last['message_id']], "b": tier_bands}
+            break
+        # Ярус исчерпан: дальше - посты старше его нижних границ
+        if not more or (tier + 2) * FEED_CHANNEL_WINDOW > FEED_MAX_WINDOW:
+            break
+        tier += 1
+        after = None
+        bands = {channel: [lo, None] for channel, (_, lo) in tier_bands.items()}
+        if len(posts) >= limit:
+            next_state = {"t": tier, "k": None, "b": bands}
+            break
+    next_cursor = _encode_cursor(next_state) if next_state is not None else None
+    
+    # Пока ни один канал не обновился, страница та же - кодируем ее один раз
+    memo_key = (category, limit, cursor)
+    versions = tuple(versions)
+    
+    # Время загрузки каналов - в заголовке, чтобы тело страницы можно было кэшировать байтами
+    headers = {
+        "Server-Timing": ", ".join(
+            f'{channel};dur={stats["elapsed_ms"]};desc="{stats["status"]}"'
+            for channel, stats in channel_stats.items()
+        ),
+        "Vary": "Accept-Encoding"
+    }
+    
+    # Версия страницы известна до сборки: неизменившуюся ленту не сериализуем вовсе
+    etag = _feed_etag(memo_key, versions)
+    if etag is not None:
+        headers["ETag"] = etag
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+    
+    memoized = feed_page_memo.get(memo_key)
+    if memoized is not None and memoized[0] == versions:
+        feed_page_memo.move_to_end(memo_key)
+        page = memoized[1]
+    else:
+        page = EncodedPage({
+            "category": category,
+            "posts": posts,
+            "total": total,
+            "next_cursor": next_cursor,
+            "partial": partial,
+            "channels": {
+                channel: {"status": stats["status"], "count": stats["count"]}
+                for channel, stats in channel_stats.items()
+            }
+        }, len(posts))
+        # Обновление любого канала меняет versions, и старые байты больше не совпадут
+        if None not in versions:
+            feed_page_memo[memo_key] = (versions, page)
+            if len(feed_page_memo) > FEED_PAGE_MEMO_MAX:
+                feed_page_memo.popitem(last=False)
+    
+    body, encoding = page.encoded(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    logger.info(f"✅ Returning {page.count} posts for category {category}")
+    return Response(body, media_type="application/json", headers=headers)
+
+class FeedSubscriber:
+    """Одно SSE соединение ленты"""
+    __slots__ = ("queue", "overflowed")
+    
+    def __init__(self, queue_max: int):
+        self.queue = asyncio.Queue(maxsize=queue_max)
+        self.overflowed = False  # Клиент не успевает читать - отправим reset и закроем поток
+
+class FeedHub:
+    """Рассылка изменений окон каналов подписчикам категорий; событие кодируется один раз на всех"""
+    def __init__(self, queue_max: int, max_subscribers: int):
+        self.queue_max = queue_max
+        self.max_subscribers = max_subscribers
+        self.subscribers = {}  # category -> set(FeedSubscriber)
+        self.count = 0
+        self.seq = itertools.count(1)
+        self.stats = {"published": 0, "dropped": 0}
     
-    # Сортируем по просмотрам
-    all_posts.sort(key=lambda x: x['views'], reverse=True)
+    def subscribe(self, category: str):
+        if self.count >= self.max_subscribers:
+            raise HTTPException(503, "Too many live feed connections")
+        subscriber = FeedSubscriber(self.queue_max)
+        self.subscribers.setdefault(category, set()).add(subscriber)
+        self.count += 1
+        return subscriber
     
-    logger.info(f"✅ Returning {len(all_posts)} posts for category {category}")
+    def unsubscribe(self, category: str, subscriber: FeedSubscriber):
+        subscribers = self.subscribers.get(category)
+        if subscribers is not None and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            self.count -= 1
+    
+    def publish(self, channel: str, old_posts, new_posts):
+        """Вызывается из PostCache.put: новые/измененные и выпавшие посты окна канала"""
+        categories = [
+            category for category, channels in WORKING_CHANNELS.items()
+            if channel in channels and self.subscribers.get(category)
+        ]
+        if not categories:
+            return
+        
+        # Первая страница ленты строится из FEED_CHANNEL_WINDOW последних постов канала - сравниваем только их.
+        # Окна - от новых к старым: дозагрузка более старых постов (глубокие страницы) эту часть не меняет,
+        # а пост, вытесненный новым из окна, уходит в removed
+        previous = {post['id']: post for post in old_posts[:FEED_CHANNEL_WINDOW]}
+        current = {post['id'] for post in new_posts[:FEED_CHANNEL_WINDOW]}
+        changed = [post for post in new_posts[:FEED_CHANNEL_WINDOW] if previous.get(post['id']) != post]
+        removed = [post_id for post_id in previous if post_id not in current]
+        if not changed and not removed:
+            return
+        
+        payload = _sse_event(
+            "posts", {"channel": channel, "posts": changed, "removed": removed}, next(self.seq)
+        ).encode("utf-8")
+        self.stats["published"] += 1
+        for category in categories:
+            for subscriber in list(self.subscribers[category]):
+                try:
+                    subscriber.queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    subscriber.overflowed = True
+                    self.unsubscribe(category, subscriber)
+                    self.stats["dropped"] += 1
+    
+    def get_stats(self):
+        return {**self.stats, "subscribers": self.count}
+
+feed_hub = FeedHub(LIVE_FEED_QUEUE_MAX, LIVE_FEED_MAX_SUBSCRIBERS)
+telegram_client.cache.on_update = feed_hub.publish
+
+@app.get("/telegram/channels/{category}/live")
+async def live_channel_posts(category: str):
+    """SSE поток изменений ленты категории: новые и обновленные посты (posts) и выпавшие (removed)"""
+    if category not in WORKING_CHANNELS:
+        raise HTTPException(404, "Invalid category")
+    subscriber = feed_hub.subscribe(category)
+    
+    async def events():
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.overflowed:
+                    # Часть изменений потеряна - клиент перечитывает ленту целиком
+                    yield _sse_event("reset", {})
+                    return
+                yield payload
+        finally:
+            feed_hub.unsubscribe(category, subscriber)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/telegram/stats")
+async def telegram_stats():
+    """Статистика загрузок из Telegram"""
     return {
-        "category": category,
-        "posts": all_posts[:limit],
-        "total": len(all_posts)
+        **telegram_client.get_stats(),
+        "photos": photo_cache.get_stats(),
+        "live_feed": feed_hub.get_stats()
     }
 
+@app.delete("/telegram/entities/{channel}")
+async def invalidate_entity(channel: str):
+    """Сброс закэшированного entity канала (после переименования)"""
+    removed = await telegram_client.invalidate_entity(channel)
+    return {"channel": channel, "invalidated": removed}
+
+demo_photo_bytes = None  # Демо фото одно на все сообщения, качаем его один раз
+demo_photo_lock = asyncio.Lock()
+
+async def _demo_photo_response():
+    """Демо изображение из памяти (загружается при первом обращении)"""
+    global demo_photo_bytes
+    if demo_photo_bytes is None:
+        async with demo_photo_lock:
+            if demo_photo_bytes is None:
+                response = await http_client.get(DEMO_PHOTO_URL)
+                if response.status_code != 200:
+                    return None
+                demo_photo_bytes = response.content
+    return Response(
+        demo_photo_bytes,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+class PhotoDownload:
+    """Загрузка фото из Telegram, отданная клиенту: iter_download и занятая им сессия пула"""
+    def __init__(self, chunks, session: TelegramSession):
+        self.chunks = chunks
+        self.session = session
+        self.released = False
+    
+    async def close(self):
+        """Закрываем загрузку и освобождаем сессию ровно один раз - из генератора тела или фоновой задачи ответа"""
+        if self.released:
+            return
+        self.released = True
+        try:
+            await self.chunks.close()
+        finally:
+            telegram_client.pool.release(self.session)
+
+async def _tee_photo(download: PhotoDownload, first_chunk: bytes, photo_id: int):
+    """Отдаем чанки фото клиенту и пишем их во временный файл кэша"""
+    f, tmp_path = await asyncio.to_thread(photo_cache.open_temp)
+    completed = False
+    try:
+        yield first_chunk
+        await asyncio.to_thread(f.write, first_chunk)
+        async for chunk in download.chunks:
+            yield chunk
+            await asyncio.to_thread(f.write, chunk)
+        completed = True
+    finally:
+        # Клиент ушел посреди отдачи - загрузку из Telegram прекращаем сразу.
+        # Фоновую задачу ответа Starlette при обрыве соединения может пропустить, поэтому и здесь
+        await download.close()
+        # Недокачанное (обрыв Telegram или клиент ушел) в кэш не попадает
+        await asyncio.to_thread(f.close)
+        try:
+            if completed:
+                await asyncio.to_thread(photo_cache.commit, photo_id, tmp_path)
+            else:
+                photo_cache.discard(tmp_path)
+        except Exception as e:
+            logger.error(f"❌ Failed to cache photo {photo_id}: {e}")
+
+async def _start_photo_download(session: TelegramSession, channel: str, message_id: int, stored_photo_id):
+    """Сообщение и первый чанк фото на одной сессии.
+    (путь в кэше, None, None, photo_id, session) или (None, чанки, первый чанк, photo_id, session)"""
+    entity = await telegram_client.resolve_entity(channel, session)
+    try:
+        await telegram_client.scheduler.throttle("history", PRIORITY_INTERACTIVE)
+        message = await session.client.get_messages(entity, ids=message_id)
+    except Exception as e:
+        await telegram_client.invalidate_on_peer_error(channel, e)
+        raise
+    
+    if not message or not message.photo:
+        raise HTTPException(404, "Photo not found")
+    
+    # Фото могло попасть в кэш раньше, даже если сообщения нет в хранилище
+    cached_path = photo_cache.get(message.photo.id) if message.photo.id != stored_photo_id else None
+    if cached_path:
+        return cached_path, None, None, message.photo.id, session
+    
+    # Первый чанк заранее: FloodWait старта загрузки тоже уходит на повтор, остальные ошибки - в fallback
+    await telegram_client.scheduler.throttle("file", PRIORITY_INTERACTIVE)
+    chunks = session.client.iter_download(message.photo)
+    try:
+        first_chunk = await chunks.__anext__()
+    except Exception as e:
+        await chunks.close()
+        if isinstance(e, StopAsyncIteration):
+            raise HTTPException(404, "Photo download failed")
+        raise
+    return None, chunks, first_chunk, message.photo.id, session
+
 @app.get("/photo/{channel}/{message_id}")
 async def get_photo(channel: str, message_id: int):
     """Получение реального фото из Telegram"""
     try:
-        if not telegram_client.connected or not telegram_client.client:
+        # Сначала дисковый кэш - без единого обращения к Telegram
+        photo_id = await post_store.photo_id(channel, message_id)
+        cached_path = photo_cache.get(photo_id) if photo_id else None
+        if cached_path:
+            return FileResponse(
+                cached_path,
+                media_type="image/jpeg",
+                headers={"Cache-Control": "public, max-age=3600"}
+            )
+        
+        if not telegram_client.connected or not telegram_client.pool.sessions:
             # Fallback на демо изображение
-            demo_url = f"https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop&seed={channel}_{message_id}"
-            response = requests.get(demo_url)
-            if response.status_code == 200:
-                return StreamingResponse(
-                    io.BytesIO(response.content),
-                    media_type="image/jpeg",
-                    headers={"Cache-Control": "public, max-age=3600"}
-                )
+            response = await _demo_photo_response()
+            if response is not None:
+                return response
             else:
                 raise HTTPException(404, "Demo photo not found")
         
-        # Получаем реальное фото из Telegram
-        entity = await telegram_client.client.get_entity(channel)
-        message = await telegram_client.client.get_messages(entity, ids=message_id)
-        
-        if not message or not message.photo:
-            raise HTTPException(404, "Photo not found")
-        
-        # Скачиваем фото в память
-        photo_bytes = await telegram_client.client.download_media(message.photo, file=bytes)
-        
-        if not photo_bytes:
-            raise HTTPException(404, "Photo download failed")
+        # Сообщение и файл - через одну сессию: entity и file_reference привязаны к аккаунту.
+        # После FloodWait планировщик повторит на другой сессии; сессия занята, пока фото не докачано клиенту
+        cached_path, chunks, first_chunk, photo_id, session = await telegram_client.scheduler.run(
+            lambda session: _start_photo_download(session, channel, message_id, photo_id),
+            max_wait=PHOTO_FLOOD_WAIT_MAX, hold=True
+        )
+        if cached_path:
+            telegram_client.pool.release(session)
+            return FileResponse(
+                cached_path,
+                media_type="image/jpeg",
+                headers={"Cache-Control": "public, max-age=3600"}
+            )
         
-        # Возвращаем фото как поток
+        # Отдаем фото клиенту по мере загрузки, параллельно заполняя кэш.
+        # Фоновая задача - на случай, если отдача тела так и не началась
+        download = PhotoDownload(chunks, session)
         return StreamingResponse(
-            io.BytesIO(photo_bytes),
+            _tee_photo(download, first_chunk, photo_id),
             media_type="image/jpeg",
-            headers={"Cache-Control": "public, max-age=3600"}
+            headers={"Cache-Control": "public, max-age=3600"},
+            background=BackgroundTask(download.close)
         )
         
     except Exception as e:
         logger.error(f"❌ Error getting photo: {e}")
         # Fallback на демо изображение
-        demo_url = f"https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop&seed={channel}_{message_id}"
-        response = requests.get(demo_url)
-        if response.status_code == 200:
-            return StreamingResponse(
-                io.BytesIO(response.content),
-                media_type="image/jpeg",
-                headers={"Cache-Control": "public, max-age=3600"}
-            )
+        try:
+            response = await _demo_photo_response()
+        except httpx.HTTPError as http_error:
+            logger.error(f"❌ Error getting demo photo: {http_error}")
+            response = None
+        if response is not None:
+            return response
         else:
             raise HTTPException(500, f"Error getting photo: {str(e)}")
 
+# Словарь терминов для промптов: слово или основа -> термин на английском.
+# Русские слова задаются основой (совпадает начало слова); основа короче PROMPT_FREE_STEM_LEN
+# букв совпадает только с окончанием своей части речи из PROMPT_RU_ENDINGS ("топ" - "топы",
+# но не "топливо" и не "топовый"), а слово с точкой на конце - только целиком ("лён." не совпадает
+# с "Лёня"). Многозначные основы ("красн" - "Красноярск", "голуб" - "голубь") - готовыми формами.
+# Английские - только целым словом, допускается множественное число
+PROMPT_VOCABULARY = {
+    "colour": {
+        "black": "black", "черн": "black", "чёрн": "black", "white": "white", "белый": "white", "белая": "white", "белое": "white", "белые": "white", "белого": "white", "белоснеж": "white",
+        "red": "red", "красный.": "red", "красная.": "red", "красное.": "red", "красные.": "red", "красного.": "red",
+        "красной.": "red", "красному.": "red", "красным.": "red", "красных.": "red", "красную.": "red", "красными.": "red", "blue": "blue", "синий": "blue", "синяя": "blue", "синее": "blue", "синие": "blue", "синего": "blue",
+        "голубой.": "light blue", "голубая.": "light blue", "голубое.": "light blue", "голубые.": "light blue",
+        "голубого.": "light blue", "голубом.": "light blue", "голубым.": "light blue", "голубых.": "light blue", "голубую.": "light blue",
+        "green": "green", "зелен": "green", "зелён": "green", "yellow": "yellow", "желт": "yellow", "жёлт": "yellow",
+        "pink": "pink", "розов": "pink", "beige": "beige", "бежев": "beige", "grey": "grey", "gray": "grey",
+        "серый": "grey", "серая": "grey", "серое": "grey", "серые": "grey", "серого": "grey", "brown": "brown", "коричнев": "brown", "шоколадн": "chocolate brown",
+        "purple": "purple", "фиолетов": "purple", "лилов": "lilac", "orange": "orange", "оранжев": "orange",
+        "бордов": "burgundy", "burgundy": "burgundy", "молочн": "milky white", "пудров": "powder pink",
+        "золот": "gold", "gold": "gold", "серебр": "silver", "silver": "silver", "хаки": "khaki", "khaki": "khaki"
+    },
+    "garment": {
+        "dress": "dress", "плать": "dress", "платье": "dress", "skirt": "skirt", "юбк": "skirt",
+        "coat": "coat", "пальт": "coat", "jacket": "jacket", "куртк": "jacket", "жакет": "jacket",
+        "пиджак": "blazer", "blazer": "blazer", "shirt": "shirt", "рубашк": "shirt", "блуз": "blouse", "блузк": "blouse", "блузок": "blouse",
+        "blouse": "blouse", "футболк": "t-shirt", "t-shirt": "t-shirt", "худи": "hoodie", "hoodie": "hoodie",
+        "свитер": "sweater", "sweater": "sweater", "джемпер": "jumper", "кардиган": "cardigan",
+        "cardigan": "cardigan", "брюк": "trousers", "trousers": "trousers", "pants": "trousers",
+        "джинс": "jeans", "jeans": "jeans", "шорт": "shorts", "shorts": "shorts", "костюм": "suit",
+        "suit": "suit", "тренч": "trench coat", "trench": "trench coat", "пуховик": "puffer jacket",
+        "шуб": "fur coat", "шубк": "fur coat", "комбинезон": "jumpsuit", "топ": "top", "топик": "top", "корсет": "corset", "жилет": "vest",
+        "обув": "shoes", "shoes": "shoes", "туфл": "heels", "туфля": "heels", "туфел": "heels", "кроссовк": "sneakers", "sneakers": "sneakers",
+        "ботин": "boots", "сапог": "boots", "boots": "boots", "сумк": "bag", "bag": "bag",
+        "шарф": "scarf", "scarf": "scarf", "шапк": "beanie", "кепк": "cap", "ремень": "belt", "belt": "belt"
+    },
+    "material": {
+        "шелк": "silk", "шёлк": "silk", "silk": "silk", "кожа": "leather", "кожан": "leather",
+        "leather": "leather", "замш": "suede", "suede": "suede", "хлопок": "cotton", "хлопк": "cotton",
+        "хлопков": "cotton", "cotton": "cotton", "лён.": "linen", "льн": "linen", "льнян": "linen", "linen": "linen", "шерст": "wool", "wool": "wool",
+        "кашемир": "cashmere", "cashmere": "cashmere", "деним": "denim", "denim": "denim",
+        "трикотаж": "knit", "вязан": "knit", "knit": "knit", "бархат": "velvet", "velvet": "velvet",
+        "кружев": "lace", "lace": "lace", "твид": "tweed", "tweed": "tweed", "атлас": "satin", "satin": "satin"
+    },
+    "style": {
+        "минимал": "minimalist", "minimal": "minimalist", "винтаж": "vintage", "vintage": "vintage",
+        "классическ": "classic", "classic": "classic", "оверсайз": "oversized", "oversize": "oversized",
+        "streetwear": "streetwear", "уличн": "streetwear", "casual": "casual", "кэжуал": "casual",
+        "элегантн": "elegant", "elegant": "elegant", "вечерн": "evening", "evening": "evening",
+        "офисн": "office", "office": "office", "спортивн": "sporty", "sport": "sporty",
+        "бохо": "boho", "boho": "boho", "летн": "summer", "summer": "summer", "зимн": "winter",
+        "winter": "winter", "осенн": "autumn", "autumn": "autumn", "весенн": "spring", "базов": "basic"
+    }
+}
+PROMPT_FREE_STEM_LEN = 5
+# Падежные окончания существительных (уменьшительные формы - отдельными основами: "шубк")
+PROMPT_RU_NOUN_ENDINGS = frozenset(
+    ["", "а", "ы", "у", "е", "о", "и", "ь", "ой", "ою", "ом", "ам", "ами", "ах", "ей", "ью", "ям", "ями", "ях", "ов"]
+)
+# Прилагательные, в том числе на -ов-/-ев- ("шелковый", "замшевый")
+PROMPT_RU_ADJECTIVE_ENDINGS = frozenset([""] + [prefix + ending for prefix in ("", "ов", "ев") for ending in (
+    "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ые", "ие", "ого", "его", "ому", "ему",
+    "ым", "им", "ых", "их", "ую", "юю", "ыми", "ими", "ом", "ем"
+)])
+# Короткие основы одежды - существительные ("топ", "шуб"), цветов и стилей - прилагательные,
+# материалов - и то и другое ("шелк" - "шелка", "шелковый")
+PROMPT_RU_ENDINGS = {
+    "colour": PROMPT_RU_ADJECTIVE_ENDINGS,
+    "garment": PROMPT_RU_NOUN_ENDINGS,
+    "material": PROMPT_RU_NOUN_ENDINGS | PROMPT_RU_ADJECTIVE_ENDINGS,
+    "style": PROMPT_RU_ADJECTIVE_ENDINGS
+}
+PROMPT_MEMO_MAX = 4096
+
+class PromptEngine:
+    """Промпты из содержимого поста по заранее скомпилированному словарю терминов"""
+    def __init__(self, vocabulary):
+        self.words = {}  # целое слово (английское с мн. числом или русское с точкой) -> (категория, термин)
+        self.stems = {}  # русская основа -> (категория, термин)
+        for category, stems in vocabulary.items():
+            for stem, term in stems.items():
+                if stem.isascii():
+                    for form in (stem, stem + "s", stem + "es"):
+                        self.words.setdefault(form, (category, term))
+                elif stem.endswith("."):
+                    self.words[stem[:-1]] = (category, term)
+                else:
+                    self.stems[stem] = (category, term)
+        # Длинные основы проверяем первыми, чтобы короткие не перехватывали слово
+        self.stem_lengths = sorted({len(stem) for stem in self.stems}, reverse=True)
+        self.token_pattern = re.compile(r"#?[\w-]+")
+        self.memo = OrderedDict()  # (id поста, текст) -> результат
+        self.stats = {"hits": 0, "misses": 0}
+    
+    def _lookup(self, token: str):
+        hit = self.words.get(token)
+        if hit is not None or token.isascii():
+            return hit
+        for length in self.stem_lengths:
+            if length <= len(token):
+                hit = self.stems.get(token[:length])
+                # Короткой основе нужно окончание своей части речи, иначе "топ" ловит "топовый"
+                if hit is not None and (length >= PROMPT_FREE_STEM_LEN or token[length:] in PROMPT_RU_ENDINGS[hit[0]]):
+                    return hit
+        return None
+    
+    def extract(self, text: str):
+        """Термины по категориям в порядке первого упоминания"""
+        found = {category: [] for category in ("colour", "garment", "material", "style")}
+        hashtags = []
+        for token in self.token_pattern.findall(text.lower()):
+            if token[0] == "#":
+                if len(hashtags) < 5 and token[1:] not in hashtags:
+                    hashtags.append(token[1:])
+                continue
+            hit = self._lookup(token)
+            if hit is not None and hit[1] not in found[hit[0]]:
+                found[hit[0]].append(hit[1])
+        found["hashtags"] = hashtags
+        return found
+    
+    def build(self, post):
+        """Промпты для поста (мемоизируются по id и тексту)"""
+        key = (post['id'], post['text'])
+        cached = self.memo.get(key)
+        if cached is not None:
+            self.memo.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        
+        keywords = self.extract(post['text'])
+        garments = " and ".join(keywords["garment"][:3]) or "a fashion look"
+        colours = ", ".join(keywords["colour"][:3]) or "neutral"
+        materials = ", ".join(keywords["material"][:2]) or "premium fabric"
+        style = ", ".join(keywords["style"][:2]) or "modern"
+        reference = "based on the reference photo, " if post['media_url'].startswith("/photo/") else ""
+        
+        result = {
+            "prompts": [
+                f"Fashion editorial photo of {garments} in {colours} tones, {style} style, {reference}inspired by @{post['channel']}, high quality, professional photography",
+                f"Studio lookbook shot of {garments}, {materials} texture, {colours} palette, soft diffused light, clean background",
+                f"Street style photo featuring {garments} with {colours} accents, {style} mood, 35mm film look, natural light"
+            ],
+            "keywords": keywords
+        }
+        self.memo[key] = result
+        if len(self.memo) > PROMPT_MEMO_MAX:
+            self.memo.popitem(last=False)
+        return result
+
+prompt_engine = PromptEngine(PROMPT_VOCABULARY)
+
+async def _find_feed_post(feed_item_id: str):
+    """Пост по id вида channel_messageid: сначала кэш ленты, потом хранилище"""
+    channel, _, message_id = feed_item_id.rpartition("_")
+    if not channel or not message_id.isdigit():
+        return None
+    post = telegram_client.cache.find_post(channel, feed_item_id)
+    if post is not None:
+        return post
+    try:
+        return await post_store.get_post(channel, int(message_id))
+    except Exception as e:
+        logger.error(f"❌ Post store error for {feed_item_id}: {e}")
+        return None
+
+def _template_prompts(feed_item_id: str):
+    """Шаблонные промпты, когда пост не найден"""
+    return [
+        f"Create a stunning fashion image inspired by {feed_item_id}",
+        f"Generate beautiful content based on {feed_item_id}",
+        f"Design an elegant concept for {feed_item_id}"
+    ]
+
+async def _prompts_for(feed_item_id: str):
+    post = await _find_feed_post(feed_item_id)
+    if post is None:
+        return {
+            "prompts": _template_prompts(feed_item_id),
+            "keywords": None,
+            "seed": random.randint(1000, 9999),
+            "provider": "telegram_real"
+        }
+    return {
+        **prompt_engine.build(post),
+        "seed": random.randint(1000, 9999),
+        "provider": "content"
+    }
+
 @app.post("/prompts/generate")
 async def gen_prompts(req: PromptReq):
-    """Генерация промптов"""
+    """Генерация промптов по содержимому поста"""
     logger.info(f"🎨 Generating prompts for: {req.feed_item_id}")
-    
+    return await _prompts_for(req.feed_item_id)
+
+@app.post("/prompts/batch")
+async def gen_prompts_batch(req: FeedItemsReq):
+    """Промпты сразу для страницы ленты"""
+    feed_item_ids = list(dict.fromkeys(req.feed_item_ids))
+    results = await asyncio.gather(*[_prompts_for(feed_item_id) for feed_item_id in feed_item_ids])
+    return {"items": dict(zip(feed_item_ids, results))}
+
+def _generation_arguments(feed_item_id: str):
+    """Параметры запроса к FAL для поста"""
+    prompt = f"Fashion image inspired by {feed_item_id}, high quality, professional photography"
+    if GEN_SEED_POLICY == "random":
+        seed = random.randint(1000, 9999)
+    else:
+        seed = zlib.crc32(prompt.encode("utf-8"))
+    return {
+        "prompt": prompt,
+        "image_size": "square_hd",
+        "num_inference_steps": 28,
+        "seed": seed
+    }
+
+def _generation_key(arguments):
+    """Ключ кэша результата или None, если результаты не переиспользуются"""
+    if GEN_SEED_POLICY == "random":
+        return None
+    return (GEN_MODEL, arguments["prompt"], arguments["image_size"],
+            arguments["num_inference_steps"], GEN_SEED_POLICY)
+
+def _demo_generation_result(feed_item_id: str, provider: str):
+    """Демо изображение вместо генерации"""
     return {
-        "prompts": [
-            f"Create a stunning fashion image inspired by {req.feed_item_id}",
-            f"Generate beautiful content based on {req.feed_item_id}",
-            f"Design an elegant concept for {req.feed_item_id}"
-        ],
+        "image_url": "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop",
+        "prompt": f"Generated image for {feed_item_id}",
         "seed": random.randint(1000, 9999),
-        "provider": "telegram_real"
+        "provider": provider
     }
 
-@app.post("/creative/generate")
-async def creative_generate(req: PromptReq):
-    """Генерация изображений"""
-    logger.info(f"🎨 Generating image for: {req.feed_item_id}")
+def _run_fal(arguments, on_status=None):
+    """Синхронный вызов FAL - выполняется в пуле потоков, а не в event loop"""
+    import fal_client
     
-    # Проверяем FAL_KEY
-    fal_key = os.getenv("FAL_KEY")
-    logger.info(f"🔍 FAL_KEY check: {fal_key is not None}")
-    if fal_key:
-        logger.info(f"🔑 FAL_KEY found: {fal_key[:20]}...")
-    else:
-        logger.warning("❌ FAL_KEY not found, using demo image")
-        return {
-            "image_url": "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop",
-            "prompt": f"Generated image for {req.feed_item_id}",
-            "seed": random.randint(1000, 9999),
-            "provider": "demo"
-        }
+    handle = fal_client.submit(GEN_MODEL, arguments=arguments)
+    if on_status is not None:
+        # Queued(position) / InProgress / Completed, пока FAL не закончит
+        for status in handle.iter_events(interval=0.5):
+            on_status(status)
+    return handle.get()
+
+def _sse_event(event: str, data, event_id=None):
+    """Одно событие в формате Server-Sent Events"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+class GenerationJobs:
+    """Очередь задач генерации изображений с ограниченным пулом воркеров"""
+    def __init__(self, workers: int, queue_max: int, job_ttl: float):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.job_ttl = job_ttl
+        self.jobs = {}  # job_id -> задача
+        self.results = OrderedDict()  # ключ генерации -> (истекает, результат)
+        self.pending = {}  # ключ генерации -> еще не завершенная задача
+        self.stats = {"cache_hits": 0, "deduplicated": 0, "submitted": 0}
+        self.next_submit_at = 0.0  # Не раньше этого момента можно отправить следующий запрос в FAL
+        self.queue = None
+        self.executor = None
+        self.tasks = []
     
-    # Используем FAL API для реальной генерации
-    try:
-        import fal_client
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_max)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fal")
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+    
+    async def submit(self, feed_item_id: str, wait: bool = False):
+        """(задача, cache) - cache: hit / inflight / miss
         
-        logger.info(f"🔑 FAL_KEY found: {fal_key[:20]}...")
+        Если очередь заполнена: wait=False - asyncio.QueueFull, wait=True - ждем места.
+        """
+        self._prune()
+        arguments = _generation_arguments(feed_item_id)
+        key = _generation_key(arguments)
         
-        # Генерируем изображение через FAL
-        logger.info(f"🎨 Submitting to FAL API...")
-        result = fal_client.submit(
-            "fal-ai/flux-pro",
-            arguments={
-                "prompt": f"Fashion image inspired by {req.feed_item_id}, high quality, professional photography",
-                "image_size": "square_hd",
-                "num_inference_steps": 28
-            }
-        )
+        # Такая же генерация уже идет - отдаем ту же задачу
+        if key is not None and key in self.pending:
+            self.stats["deduplicated"] += 1
+            return self.pending[key], "inflight"
         
-        logger.info(f"⏳ Waiting for FAL API result...")
-        # Получаем результат
-        result = fal_client.wait(result)
-        image_url = result["images"][0]["url"]
-        prompt = f"Generated image for {req.feed_item_id}"
-        
-        logger.info(f"✅ Generated image for {req.feed_item_id}: {image_url}")
-        return {
-            "image_url": image_url,
-            "prompt": prompt,
-            "seed": random.randint(1000, 9999),
-            "provider": "fal_ai"
+        job = {
+            "id": uuid.uuid4().hex,
+            "feed_item_id": feed_item_id,
+            "arguments": arguments,
+            "key": key,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "queue_position": None,  # Позиция в очереди FAL
+            "version": 0,  # Растет при каждом изменении - id события SSE
+            "changed": asyncio.Event()
         }
+        cached = self._cached_result(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            logger.info(f"📦 Using cached generation for {feed_item_id}")
+            self._finish(job, cached)
+            outcome = "hit"
+        elif not os.getenv("FAL_KEY"):
+            logger.warning("❌ FAL_KEY not found, using demo image")
+            self._finish(job, _demo_generation_result(feed_item_id, "demo"))
+            outcome = "miss"
+        else:
+            # Регистрируем до ожидания места, чтобы параллельные дубли нашли эту задачу
+            if key is not None:
+                self.pending[key] = job
+            try:
+                if wait:
+                    await self.queue.put(job)
+                else:
+                    self.queue.put_nowait(job)
+            except BaseException:
+                if self.pending.get(key) is job:
+                    del self.pending[key]
+                raise
+            self.stats["submitted"] += 1
+            outcome = "miss"
+        self.jobs[job["id"]] = job
+        return job, outcome
+    
+    async def wait_done(self, job):
+        """Ждем завершения задачи"""
+        while True:
+            changed = job["changed"]
+            if job["status"] == "done":
+                return job
+            await changed.wait()
+    
+    def _cached_result(self, key):
+        if key is None or key not in self.results:
+            return None
+        expires_at, result = self.results[key]
+        if time.time() >= expires_at:
+            del self.results[key]
+            return None
+        self.results.move_to_end(key)
+        return result
+    
+    def _store_result(self, key, result):
+        self.results[key] = (time.time() + GEN_RESULT_TTL, result)
+        self.results.move_to_end(key)
+        while len(self.results) > GEN_RESULT_MAX:
+            self.results.popitem(last=False)
+    
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+    
+    def _finish(self, job, result, error: str = None):
+        job["status"] = "done"
+        job["result"] = result
+        job["error"] = error
+        job["finished_at"] = time.time()
+        job["queue_position"] = None
+        self._notify(job)
+    
+    def _notify(self, job):
+        """Будим подписчиков SSE: старое событие срабатывает, новое ждет следующего изменения"""
+        job["version"] += 1
+        changed, job["changed"] = job["changed"], asyncio.Event()
+        changed.set()
+    
+    def _on_fal_status(self, job, status):
+        """Статус FAL (вызывается в event loop из потока воркера)"""
+        import fal_client
         
-    except Exception as e:
-        logger.error(f"❌ FAL API error: {e}")
-        # Fallback на демо изображение
+        if job["status"] == "done":
+            return
+        if isinstance(status, fal_client.Queued):
+            if job["status"] == "queued" and job["queue_position"] == status.position:
+                return
+            job["status"] = "queued"
+            job["queue_position"] = status.position
+        elif isinstance(status, fal_client.InProgress):
+            if job["status"] == "running":
+                return
+            job["status"] = "running"
+            job["queue_position"] = None
+        else:
+            return
+        self._notify(job)
+    
+    async def subscribe(self, job, last_version=None):
+        """Поток состояний задачи до завершения (None - пинг)"""
+        while True:
+            changed = job["changed"]
+            if job["version"] != last_version:
+                last_version = job["version"]
+                yield job
+            if job["status"] == "done":
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield None
+    
+    def _prune(self):
+        """Убираем давно завершенные задачи"""
+        deadline = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job["finished_at"] and job["finished_at"] < deadline]:
+            del self.jobs[job_id]
+    
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self._notify(job)
+            feed_item_id = job["feed_item_id"]
+            
+            def on_status(status, job=job):
+                loop.call_soon_threadsafe(self._on_fal_status, job, status)
+            
+            try:
+                await self._throttle()
+                logger.info(f"🎨 Submitting {feed_item_id} to FAL API...")
+                result = await loop.run_in_executor(
+                    self.executor, _run_fal, job["arguments"], on_status
+                )
+                image_url = result["images"][0]["url"]
+                logger.info(f"✅ Generated image for {feed_item_id}: {image_url}")
+                result = {
+                    "image_url": image_url,
+                    "prompt": f"Generated image for {feed_item_id}",
+                    "seed": job["arguments"]["seed"],
+                    "provider": "fal_ai"
+                }
+                # Кэшируем только настоящие генерации, демо-фолбэк - нет
+                if job["key"] is not None:
+                    self._store_result(job["key"], result)
+                self._finish(job, result)
+            except Exception as e:
+                logger.error(f"❌ FAL API error: {e}")
+                # Fallback на демо изображение
+                self._finish(job, _demo_generation_result(feed_item_id, "demo_fallback"), str(e))
+            finally:
+                if self.pending.get(job["key"]) is job:
+                    del self.pending[job["key"]]
+                self.queue.task_done()
+    
+    async def _throttle(self):
+        """Ограничение частоты отправок в FAL (GEN_SUBMIT_RATE в секунду)"""
+        if GEN_SUBMIT_RATE <= 0:
+            return
+        now = time.monotonic()
+        submit_at = max(now, self.next_submit_at)
+        self.next_submit_at = submit_at + 1 / GEN_SUBMIT_RATE
+        if submit_at > now:
+            await asyncio.sleep(submit_at - now)
+    
+    def get_stats(self):
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
         return {
-            "image_url": "https://images.unsplash.com/photo-1441986300917-64674bd600d8?w=400&h=600&fit=crop",
-            "prompt": f"Generated image for {req.feed_item_id}",
-            "seed": random.randint(1000, 9999),
-            "provider": "demo_fallback"
+            **self.stats,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_max": self.queue_max,
+            "workers": self.workers,
+            "jobs": statuses,
+            "cached_results": len(self.results)
         }
 
+generation_jobs = GenerationJobs(GEN_WORKERS, GEN_QUEUE_MAX, GEN_JOB_TTL)
+
+def _job_view(job):
+    """Публичное представление задачи генерации"""
+    return {
+        "job_id": job["id"],
+        "feed_item_id": job["feed_item_id"],
+        "status": job["status"],
+        "queue_position": job["queue_position"],
+        "result": job["result"],
+        "error": job["error"]
+    }
+
+@app.post("/creative/generate")
+async def creative_generate(req: PromptReq):
+    """Постановка генерации изображения в очередь"""
+    logger.info(f"🎨 Generating image for: {req.feed_item_id}")
+    try:
+        job, cache = await generation_jobs.submit(req.feed_item_id)
+    except asyncio.QueueFull:
+        raise HTTPException(429, "Generation queue is full, try again later")
+    return {**_job_view(job), "cache": cache}
+
+@app.post("/creative/batch")
+async def creative_batch(req: FeedItemsReq):
+    """Генерация для нескольких постов: результаты NDJSON по мере готовности"""
+    feed_item_ids = list(dict.fromkeys(req.feed_item_ids))
+    if not feed_item_ids:
+        raise HTTPException(400, "feed_item_ids is empty")
+    if len(feed_item_ids) > GEN_BATCH_MAX:
+        raise HTTPException(400, f"Too many feed items, max {GEN_BATCH_MAX}")
+    logger.info(f"🎨 Batch generation for {len(feed_item_ids)} posts")
+    
+    async def generate_one(feed_item_id: str):
+        # Очередь и воркеры ограничивают параллельность, batch ждет свободного места
+        job, cache = await generation_jobs.submit(feed_item_id, wait=True)
+        await generation_jobs.wait_done(job)
+        return {**_job_view(job), "cache": cache}
+    
+    async def results():
+        tasks = [asyncio.ensure_future(generate_one(feed_item_id)) for feed_item_id in feed_item_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился - перестаем ждать; поставленные задачи доработают и попадут в кэш
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/creative/jobs/{job_id}")
+async def creative_job(job_id: str):
+    """Статус и результат задачи генерации"""
+    job = generation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return _job_view(job)
+
+@app.get("/creative/jobs/{job_id}/events")
+async def creative_job_events(job_id: str, request: Request):
+    """SSE поток статусов задачи генерации: queued / running / done"""
+    job = generation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    
+    # При переподключении EventSource присылает последний полученный id
+    last_event_id = request.headers.get("last-event-id")
+    last_version = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    async def events():
+        async for state in generation_jobs.subscribe(job, last_version):
+            if state is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _sse_event(state["status"], _job_view(state), state["version"])
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/creative/stats")
+async def creative_stats():
+    """Глубина очереди и статусы задач генерации"""
+    return generation_jobs.get_stats()
+
 @app.get("/ui", response_class=HTMLResponse)
 def ui():
     """Главная страница с UI"""
@@ -400,16 +2628,21 @@ def ui():
     </div>
 
     <script>
+        const feedLimit = 6;
+        let feedPosts = [];
+        let feedEvents = null;
+        
         async function loadFeed(category) {
             // Показываем загрузку
             document.getElementById('feed').innerHTML = '<div class="loading">Loading real posts from Telegram...</div>';
             
             try {
-                const response = await fetch(`/telegram/channels/${category}?limit=6`);
+                const response = await fetch(`/telegram/channels/${category}?limit=${feedLimit}`);
                 const data = await response.json();
                 
                 if (data.posts) {
-                    displayPosts(data.posts);
+                    feedPosts = data.posts;
+                    displayPosts(feedPosts);
                 } else {
                     document.getElementById('feed').innerHTML = '<div class="loading">No posts found</div>';
                 }
@@ -417,6 +2650,46 @@ def ui():
                 console.error('Error loading feed:', error);
                 document.getElementById('feed').innerHTML = '<div class="loading">Error loading posts</div>';
             }
+            subscribeFeed(category);
+        }
+        
+        // Новые и обновленные посты приходят по SSE - перезагружать страницу не нужно
+        function subscribeFeed(category) {
+            if (feedEvents) {
+                return;
+            }
+            let lost = false;
+            feedEvents = new EventSource(`/telegram/channels/${category}/live`);
+            feedEvents.addEventListener('posts', e => {
+                const diff = JSON.parse(e.data);
+                const byId = new Map(feedPosts.map(post => [post.id, post]));
+                diff.removed.forEach(id => byId.delete(id));
+                diff.posts.forEach(post => byId.set(post.id, post));
+                // Порядок как на сервере: просмотры, затем канал и свежесть
+                const posts = [...byId.values()].sort((a, b) =>
+                    b.views - a.views || (a.channel < b.channel ? -1 : a.channel > b.channel ? 1 : 0) || b.message_id - a.message_id
+                );
+                if (posts.length < feedLimit && feedPosts.length >= feedLimit) {
+                    // Выпавший пост должен заменить следующий из ленты, а его у нас нет - перечитываем
+                    loadFeed(category);
+                    return;
+                }
+                feedPosts = posts.slice(0, feedLimit);
+                displayPosts(feedPosts);
+            });
+            // Сервер отстал от нас или соединение рвалось - изменения могли потеряться, перечитываем ленту
+            feedEvents.addEventListener('reset', () => {
+                feedEvents.close();
+                feedEvents = null;
+                loadFeed(category);
+            });
+            feedEvents.onerror = () => { lost = true; };
+            feedEvents.onopen = () => {
+                if (lost) {
+                    lost = false;
+                    loadFeed(category);
+                }
+            };
         }
         
         function displayPosts(posts) {
@@ -460,8 +2733,26 @@ def ui():
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ feed_item_id: feedItemId })
                 });
-                const data = await response.json();
-                window.open(data.image_url, '_blank');
+                let job = await response.json();
+                if (!response.ok) {
+                    alert(job.detail || 'Error generating image');
+                    return;
+                }
+                if (job.status === 'done') {
+                    window.open(job.result.image_url, '_blank');
+                    return;
+                }
+                // Ждем завершения задачи через SSE, EventSource сам переподключается
+                const events = new EventSource(`/creative/jobs/${job.job_id}/events`);
+                events.addEventListener('queued', e => {
+                    const state = JSON.parse(e.data);
+                    console.log('Generation queued, position:', state.queue_position);
+                });
+                events.addEventListener('running', () => console.log('Generation running'));
+                events.addEventListener('done', e => {
+                    events.close();
+                    window.open(JSON.parse(e.data).result.image_url, '_blank');
+                });
             } catch (error) {
                 console.error('Error generating image:', error);
                 alert('Error generating image');
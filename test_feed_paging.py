@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тест листания ленты по курсору, пока в каналах появляются новые посты (без Telegram)
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+
+import httpx
+from telethon.tl.types import InputPeerChannel
+
+# Хранилище и кэш фото - во временной папке, Telegram и фоновые задачи выключены
+TMP_DIR = tempfile.mkdtemp()
+os.environ.update(
+    TELEGRAM_API_ID="", TELEGRAM_API_HASH="", TELEGRAM_SESSION="", TELEGRAM_SESSIONS="",
+    POST_STORE_PATH=os.path.join(TMP_DIR, "posts.db"), PHOTO_CACHE_DIR=os.path.join(TMP_DIR, "photos"),
+    WARMER_ENABLED="0", LIVE_UPDATES_ENABLED="0",
+    TG_RATE_RESOLVE="1000", TG_RATE_HISTORY="1000", TG_RATE_FILE="1000"
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+class FakeMessage:
+    """Сообщение канала: просмотры не растут со свежестью, чтобы старые посты попадали выше новых"""
+    def __init__(self, message_id: int):
+        self.id = message_id
+        self.text = f"post {message_id}"
+        self.views = 500 + (message_id * 7919) % 5000
+        self.reactions = None
+        self.replies = None
+        self.date = datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=message_id)
+        self.photo = None
+        self.media = None
+
+class FakeTelegram:
+    """Минимальный клиент Telethon: история канала из message_id 1..count"""
+    def __init__(self, count: int):
+        self.counts = {}
+        self.count = count
+        self.usernames = []
+
+    async def get_entity(self, username):
+        if username not in self.usernames:
+            self.usernames.append(username)
+        return InputPeerChannel(self.usernames.index(username) + 1, 0)
+
+    async def iter_messages(self, entity, limit=None, min_id=0, offset_id=0, max_id=0, **kwargs):
+        username = self.usernames[entity.channel_id - 1]
+        newest = self.counts.setdefault(username, self.count)
+        yielded = 0
+        for message_id in range(newest, 0, -1):
+            if message_id <= min_id or (offset_id and message_id >= offset_id) or (max_id and message_id >= max_id):
+                continue
+            yield FakeMessage(message_id)
+            yielded += 1
+            if limit and yielded >= limit:
+                break
+
+async def _walk_feed(limit: int, new_post_every: int):
+    """Листаем ленту до конца; каждые new_post_every страниц в каждом канале выходит пост"""
+    fake = FakeTelegram(count=300)
+    session = main.TelegramSession("fake", fake)
+    session.account = 1
+    main.telegram_client.pool.sessions = [session]
+    main.telegram_client.connected = True
+    channels = main.WORKING_CHANNELS["fashion"]
+
+    expected = {f"{channel}_{message_id}" for channel in channels for message_id in range(1, 301)}
+    seen = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/telegram/channels/fashion", params=params)
+            assert response.status_code == 200, response.text
+            data = response.json()
+            seen += [post["id"] for post in data["posts"]]
+            pages += 1
+            if pages % new_post_every == 0:
+                for channel in channels:
+                    fake.counts[channel] = fake.counts.get(channel, 300) + 1
+                    await main.telegram_client.refresh_channel(channel, main.FEED_CHANNEL_WINDOW)
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+    return seen, expected
+
+def test_feed_paging_with_new_posts():
+    """Ни один пост не пропущен и не повторен, пока каналы обновляются посреди листания"""
+    seen, expected = asyncio.run(_walk_feed(limit=7, new_post_every=3))
+    duplicates = len(seen) - len(set(seen))
+    missing = expected - set(seen)
+    print(f"📄 Seen {len(seen)} posts, {duplicates} duplicates, {len(missing)} missing")
+    assert duplicates == 0
+    assert not missing, sorted(missing)[:20]
+
+if __name__ == "__main__":
+    test_feed_paging_with_new_posts()
+    print("✅ Feed paging test passed")
@@ -7,10 +7,11 @@ from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 import io
 import time
-import requests
 import logging
 import os
 import asyncio
+import heapq
+import itertools
 from datetime import datetime, timedelta
 import random
 
@@ -185,18 +186,19 @@ async def get_channel_posts(category: str, limit: int = 6):
         if category not in WORKING_CHANNELS:
             raise HTTPException(404, f"Category {category} not found")
         
-        all_posts = []
+        channel_posts = []
         for channel in WORKING_CHANNELS[category]:
             posts = await telegram_client.get_channel_posts(channel, limit)
-            all_posts.extend(posts)
+            channel_posts.append(posts)
         
-        # Сортируем по дате (новые сначала)
-        all_posts.sort(key=lambda x: x['date'], reverse=True)
+        # Посты каждого канала уже идут от новых к старым (так их отдает iter_messages),
+        # поэтому сливаем их по дате без полной сортировки и останавливаемся на limit
+        merged = heapq.merge(*channel_posts, key=lambda x: x['date'], reverse=True)
         
         return {
             "category": category,
-            "posts": all_posts[:limit],
-            "total": len(all_posts)
+            "posts": list(itertools.islice(merged, limit)),
+            "total": sum(len(posts) for posts in channel_posts)
         }
     except Exception as e:
         logger.error(f"❌ Error getting posts: {e}")